@@ -0,0 +1,118 @@
+import os
+import asyncio
+import logging
+import uvicorn
+
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+import auto_translator
+
+from auto_translator import (
+    cache, convert_pinyin_to_english, generate_prompt, glossary, memory, record_usage, translation_context, translation_key
+)
+from concurrency import AsyncSingleFlight, AsyncUpstreamPool, Overloaded
+from model_backend import get_backend
+from upstream_guard import CircuitOpen
+
+# Same limits as the gevent server, enforced on the event loop
+upstream = AsyncUpstreamPool(
+    max_concurrency=int(os.getenv("TRANSLATION_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("TRANSLATION_MAX_QUEUE", "64")),
+    timeout=float(os.getenv("TRANSLATION_TIMEOUT", "30")),
+)
+
+inflight = AsyncSingleFlight()
+
+# Backends without an async client run their blocking calls on a pool sized like the limiter
+rest_executor = ThreadPoolExecutor(max_workers=upstream.max_concurrency)
+
+async def call_blocking(fn, *args):
+    """Runs a blocking client call on the shared executor."""
+    return await asyncio.get_running_loop().run_in_executor(rest_executor, fn, *args)
+
+async def request_translation(text):
+    """Sends a single text to the model and returns the raw translation."""
+    prompt = generate_prompt(text)
+    if get_backend().has_async_client:
+        response = await upstream.apply(auto_translator.model.generate_content_async, prompt)
+    else:
+        response = await upstream.apply(call_blocking, auto_translator.model.generate_content, prompt)
+    record_usage("single", response)
+    return response.text
+
+async def handle_translation(text, cache_key=None, context=None):
+    """Handles the translation of the input text."""
+    text = unquote(text)
+
+    term = glossary.lookup(text)
+    if term is not None:
+        return term
+
+    context = context or translation_context(text)
+    cache_key = cache_key or translation_key(text, context)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    remembered = memory.lookup(text, context)
+    if remembered is not None:
+        cache.set(cache_key, remembered)
+        return remembered
+
+    try:
+        translation = convert_pinyin_to_english(await request_translation(text))
+        cache.set(cache_key, translation)
+        glossary.harvest(text, translation)
+        memory.add(text, translation, context)
+        return translation
+    except (Overloaded, CircuitOpen):
+        raise
+    except Exception as e:
+        logging.error(f"There was a problem with the request! Error message: {e}")
+        return False
+
+async def translate(request):
+    """API endpoint for text translation."""
+    text = request.query_params.get('text')
+    logging.info(f"Received Text: {text}")
+
+    try:
+        context = translation_context(unquote(text))
+        cache_key = translation_key(unquote(text), context)
+        translation = await inflight.do(cache_key, handle_translation, text, cache_key, context)
+        if translation:
+            logging.info(f"Translation Response: {translation}")
+            return PlainTextResponse(translation)
+        else:
+            return PlainTextResponse("Translation failed", status_code=500)
+    except Overloaded as e:
+        logging.warning(f"Rejected translation: {e}")
+        return PlainTextResponse("Translator overloaded", status_code=503)
+    except CircuitOpen as e:
+        logging.warning(f"Rejected translation: {e}")
+        return PlainTextResponse("Translator unavailable", status_code=503, headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except Exception as e:
+        logging.info(f"Error during translation: {e}")
+        return PlainTextResponse("Translation failed", status_code=500)
+
+app = Starlette(routes=[
+    Route('/translate', translate, methods=['GET']),
+])
+
+def run_async_translation(host, port, workers=1):
+    """Runs the ASGI translation server with uvicorn."""
+    print(f"Server starting at http://{host}:{port} (asgi, {workers} worker(s))")
+    # Worker processes inherit this and split the rate budgets between them
+    os.environ["UPSTREAM_PROCESSES"] = str(workers)
+    uvicorn.run(
+        "asgi_translator:app",
+        host=host,
+        port=port,
+        workers=workers,
+        log_level="warning",
+        access_log=False,
+    )
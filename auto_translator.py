@@ -1,253 +1,670 @@
 import os
-import google.generativeai as genai
+import re
+import json
+import time
+import queue
+import random
+import signal
+import argparse
+import gevent
 import pypinyin
 import logging
 
-from flask import Flask, request
+from flask import Flask, Response, g, request
+from gevent.pool import Pool
+from gevent.queue import Queue
 from gevent.pywsgi import WSGIServer
+from logging.handlers import QueueHandler, QueueListener
 from urllib.parse import unquote
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from glossary import Glossary
+from metrics import Registry
+from model_backend import lazy_text_model, upstream_stats
+from prefork import listen, run_prefork
+from concurrency import Overloaded, SingleFlight, UpstreamPool
+from translation_batcher import TranslationBatcher
+from translation_cache import TranslationCache, make_cache_key
+from translation_memory import TranslationMemory
+from tracing import span, start_trace
+from upstream_guard import CircuitOpen
 
 load_dotenv()
 
 app = Flask(__name__)
 
 http_server = None
+log_listener = None
 
-genai.configure(api_key=os.getenv("API_KEY"))
+# Server settings shared by the gevent and ASGI modes
+TRANSLATION_SERVER = os.getenv("TRANSLATION_SERVER", "gevent")
+TRANSLATION_HOST = os.getenv("TRANSLATION_HOST", "127.0.0.1")
+TRANSLATION_PORT = int(os.getenv("TRANSLATION_PORT", "4000"))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", "1"))
+# Seconds the requests in flight get to finish when the server is stopped
+TRANSLATION_DRAIN_TIMEOUT = float(os.getenv("TRANSLATION_DRAIN_TIMEOUT", "5"))
 
-model = genai.GenerativeModel("gemini-1.5-flash")
+MODEL_NAME = os.getenv("TRANSLATION_MODEL", "gemini-1.5-flash")
 
-def generate_system_prompt(text):
-    """Generates a system prompt for translation."""
-    return (
-        f'Translate the following text: "{text}" from Simplified Chinese into English, ensuring a direct and accurate translation while preserving the original meaning and context. '
-        'Edit and restructure the sentence to flow naturally in English, but without changing the intended message. Keep special characters as they are and use Pinyin romanization for Chinese names or terms. '
-        'The translation should be clear and concise, with no added words or interpretations beyond the original text. Only return the translated text without any remarks or notes.'
-    )
+# Instructions go in the model's system-instruction slot, so each request only carries its text
+TRANSLATION_INSTRUCTION = (
+    'Translate the user\'s text from Simplified Chinese into English. Keep the meaning and context exact, '
+    'restructured to read naturally in English, with no added words or interpretations. '
+    'Keep special characters as they are and use Pinyin romanization for Chinese names or terms. '
+    'Blocks before the text are context, not to be translated: "Glossary:" gives the required translation of terms in it, '
+    '"Similar:" earlier translations of similar lines to stay consistent with. '
+    'Reply with the translation only, without remarks or notes.'
+)
 
-def handle_translation(text):
-    """Handles the translation of the input text."""
-    text = unquote(text)
-    prompt = generate_system_prompt(text)
+BATCH_INSTRUCTION = (
+    'Translate each string of the JSON array the user sends from Simplified Chinese into English. Keep the meaning and context exact, '
+    'restructured to read naturally in English, with no added words or interpretations. '
+    'Keep special characters as they are and use Pinyin romanization for Chinese names or terms. '
+    'Blocks before the array are context, not to be translated: "Glossary:" gives the required translation of terms in it, '
+    '"Similar:" earlier translations of similar lines to stay consistent with. '
+    'Reply with a JSON array holding exactly one translated string per input string, in the same order.'
+)
 
+def load_translation_context(path):
+    """Reads the fixed context (e.g. a glossary or style guide) appended to the instructions."""
+    if not path:
+        return ""
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+# Fixed context shared by every request, kept in a context cache for TRANSLATION_CONTEXT_CACHE_TTL seconds if set
+TRANSLATION_CONTEXT = load_translation_context(os.getenv("TRANSLATION_CONTEXT_PATH", ""))
+CONTEXT_CACHE_TTL = float(os.getenv("TRANSLATION_CONTEXT_CACHE_TTL", "0")) or None
+
+def build_system_instruction(instruction):
+    """Combines an instruction with the fixed translation context."""
+    if TRANSLATION_CONTEXT:
+        return f"{instruction}\n\n{TRANSLATION_CONTEXT}"
+    return instruction
+
+SYSTEM_INSTRUCTION = build_system_instruction(TRANSLATION_INSTRUCTION)
+
+# Created on first use, on the backend selected by MODEL_BACKEND; one per system instruction
+model = lazy_text_model(MODEL_NAME, SYSTEM_INSTRUCTION, CONTEXT_CACHE_TTL)
+batch_model = lazy_text_model(MODEL_NAME, build_system_instruction(BATCH_INSTRUCTION), CONTEXT_CACHE_TTL)
+
+# Terminology memory: the user's glossary plus term pairs harvested from translations
+glossary = Glossary(
+    path=os.getenv("TRANSLATION_GLOSSARY_PATH", "glossary.tsv") or None,
+    terms_path=os.getenv("TRANSLATION_TERMS_PATH", "translation_terms.db") or None,
+    max_hints=int(os.getenv("TRANSLATION_GLOSSARY_MAX_HINTS", "32")),
+    min_term_chars=max(2, int(os.getenv("TRANSLATION_TERM_MIN_CHARS", "2"))),
+    max_term_chars=int(os.getenv("TRANSLATION_TERM_MAX_CHARS", "8")),
+)
+
+# Lines that differ only in numbers, placeholders or tags reuse one translation template
+memory = TranslationMemory(
+    path=os.getenv("TRANSLATION_MEMORY_PATH", "translation_memory.db") or None,
+    suggest_threshold=float(os.getenv("TRANSLATION_MEMORY_SUGGEST", "0.5")),
+    reuse_threshold=float(os.getenv("TRANSLATION_MEMORY_REUSE", "0")),
+)
+
+# Translation cache: in-memory LRU backed by a SQLite file that survives restarts
+cache_ttl = float(os.getenv("TRANSLATION_CACHE_TTL", "0"))
+cache = TranslationCache(
+    path=os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.db") or None,
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000")),
+    ttl=cache_ttl if cache_ttl > 0 else None,
+)
+
+# Shared, bounded pool for upstream model calls
+upstream = UpstreamPool(
+    max_concurrency=int(os.getenv("TRANSLATION_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("TRANSLATION_MAX_QUEUE", "64")),
+    timeout=float(os.getenv("TRANSLATION_TIMEOUT", "30")),
+    mode=os.getenv("TRANSLATION_POOL_MODE", "thread"),
+)
+
+# Texts translated at once per /translate/batch request
+BULK_CONCURRENCY = int(os.getenv("TRANSLATION_BULK_CONCURRENCY", "16"))
+
+# Identical requests that arrive while one is already in flight share its result
+inflight = SingleFlight()
+
+# Fraction of requests whose texts are logged, and of requests traced span by span
+TRANSLATION_LOG_SAMPLE = float(os.getenv("TRANSLATION_LOG_SAMPLE", "0.01"))
+TRANSLATION_TRACE_SAMPLE = float(os.getenv("TRANSLATION_TRACE_SAMPLE", "0"))
+TRANSLATION_LOG_LEVEL = os.getenv("TRANSLATION_LOG_LEVEL", "INFO")
+
+# Served at /metrics in the Prometheus text format
+metrics = Registry()
+request_seconds = metrics.histogram(
+    "translator_request_seconds", "Time until the response headers are sent, by endpoint.", ["endpoint"]
+)
+requests_total = metrics.counter("translator_requests_total", "Requests answered, by endpoint and status.", ["endpoint", "status"])
+upstream_seconds = metrics.histogram(
+    "translator_upstream_seconds", "Time spent in upstream model calls, queueing included, by call kind.", ["kind"]
+)
+pinyin_seconds = metrics.histogram("translator_pinyin_seconds", "Time spent converting leftover Han characters to Pinyin.")
+in_flight = metrics.gauge("translator_in_flight_requests", "Requests being handled.")
+errors_total = metrics.counter("translator_errors_total", "Failed translations, by exception type.", ["type"])
+tokens_total = metrics.counter(
+    "translator_tokens_total", "Tokens billed for upstream calls, by call kind and type (input, cached, output).", ["kind", "type"]
+)
+call_tokens = metrics.histogram(
+    "translator_call_tokens", "Tokens per upstream call, by call kind and type (input, cached, output).", ["kind", "type"],
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 32768),
+)
+
+def record_usage(kind, response):
+    """Records the token usage an upstream response reports."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for token_type, attribute in (("input", "prompt_token_count"), ("cached", "cached_content_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, attribute, 0) or 0
+        tokens_total.inc(count, kind=kind, type=token_type)
+        call_tokens.observe(count, kind=kind, type=token_type)
+
+@metrics.collector
+def component_stats():
+    """Exposes the counters the cache, upstream pool, batcher and upstream guard already keep."""
+    cache_stats = cache.stats()
+    glossary_stats = glossary.stats()
+    memory_stats = memory.stats()
+    guard = upstream_stats()
+    return [
+        ("translator_cache_hits_total", "counter", "Cache hits, from memory or disk.", cache_stats["hits"]),
+        ("translator_cache_disk_hits_total", "counter", "Cache hits served from the SQLite file.", cache_stats["disk_hits"]),
+        ("translator_cache_misses_total", "counter", "Cache misses.", cache_stats["misses"]),
+        ("translator_cache_evictions_total", "counter", "Translations evicted from memory.", cache_stats["evictions"]),
+        ("translator_cache_entries", "gauge", "Translations held in memory.", cache_stats["memory_entries"]),
+        ("translator_coalesced_requests_total", "counter", "Requests that shared an identical in-flight translation.", inflight.followers),
+        ("translator_upstream_pending", "gauge", "Upstream calls running or queued.", upstream.pending),
+        ("translator_upstream_rejected_total", "counter", "Upstream calls rejected because the queue was full.", upstream.rejected),
+        ("translator_upstream_timeouts_total", "counter", "Upstream calls that missed their deadline.", upstream.timed_out),
+        ("translator_batches_total", "counter", "Batched upstream calls.", batcher.batches),
+        ("translator_batched_items_total", "counter", "Texts translated in batched calls.", batcher.batched_items),
+        ("translator_batch_fallbacks_total", "counter", "Batches retried text by text.", batcher.fallbacks),
+        ("translator_glossary_terms", "gauge", "Glossary terms, by origin.", {
+            (("origin", "user"),): glossary_stats["user_terms"], (("origin", "harvested"),): glossary_stats["harvested_terms"],
+        }),
+        ("translator_glossary_exact_hits_total", "counter", "Texts answered from the glossary without a model call.", glossary_stats["exact_hits"]),
+        ("translator_glossary_hinted_prompts_total", "counter", "Prompts sent with glossary entries.", glossary_stats["hinted"]),
+        ("translator_glossary_harvested_total", "counter", "Term pairs harvested from model translations.", glossary_stats["harvested"]),
+        ("translator_memory_templates", "gauge", "Translation templates remembered.", memory_stats["templates"]),
+        ("translator_memory_hits_total", "counter", "Texts answered from the translation memory, by match.", {
+            (("match", "template"),): memory_stats["template_hits"], (("match", "fuzzy"),): memory_stats["fuzzy_hits"],
+        }),
+        ("translator_memory_suggested_prompts_total", "counter", "Prompts sent with similar earlier translations.", memory_stats["suggested"]),
+        ("upstream_calls_total", "counter", "Upstream call attempts, retries included.", guard["calls"]),
+        ("upstream_retries_total", "counter", "Upstream calls retried after a transient error.", guard["retries"]),
+        ("upstream_failures_total", "counter", "Upstream calls that failed for good.", guard["failures"]),
+        ("upstream_breaker_rejected_total", "counter", "Upstream calls rejected by the open circuit breaker.", guard["rejected"]),
+        ("upstream_limited_total", "counter", "Upstream calls delayed by the rate limiter.", guard["limited"]),
+        ("upstream_limiter_wait_seconds_total", "counter", "Time upstream calls waited for the rate limiter.", guard["limiter_wait_seconds"]),
+        ("upstream_breaker_opened_total", "counter", "Times the circuit breaker opened.", guard["breaker_opened"]),
+        ("upstream_breaker_state", "gauge", "Circuit breaker state, 1 for the current one.", {
+            (("state", state),): int(guard["breaker_state"] == state) for state in ("closed", "open", "half_open")
+        }),
+    ]
+
+# Called with a dict for every answered request; the GUI supervisor streams them to the window
+request_listeners = []
+
+def log_sampled(message, *args):
+    """Logs a per-request message for a sample of requests only."""
+    if TRANSLATION_LOG_SAMPLE and random.random() < TRANSLATION_LOG_SAMPLE:
+        logging.info(message, *args)
+
+def record_error(e, message):
+    """Counts a failed translation by exception type and logs it."""
+    errors_total.inc(type=type(e).__name__)
+    logging.error("%s: %s", message, e)
+
+def generate_prompt(text):
+    """Generates the prompt for translating a text: the glossary entries and similar earlier lines, then the text.
+
+    The instructions are in the system instruction.
+    """
+    blocks = [block for block in (glossary.hints([text]), memory.hints([text])) if block]
+    return "\n\n".join(blocks + [text])
+
+def generate_batch_prompt(texts):
+    """Generates the prompt for translating several texts at once."""
+    blocks = [block for block in (glossary.hints(texts), memory.hints(texts)) if block]
+    return "\n\n".join(blocks + [json.dumps(texts, ensure_ascii=False)])
+
+def translation_key(text, context=None):
+    """Cache key of a text, covering the model, the instructions and the glossary file entries it uses.
+
+    Harvested terms are left out, or every newly harvested term would orphan
+    the cached translations of all lines containing it. ``context`` is the
+    ``translation_context`` of the text when the caller already has it.
+    """
+    model_name, instructions = context or translation_context(text)
+    return make_cache_key(text, instructions, model_name)
+
+def translation_context(text):
+    """Returns the model and the instructions with glossary file entries a translation of ``text`` depends on."""
+    entries = glossary.matches([text], harvested=False)
+    return MODEL_NAME, SYSTEM_INSTRUCTION + "".join(f"\n{source}={target}" for source, target in entries)
+
+def request_translation(text):
+    """Sends a single text to the model and returns the raw translation."""
+    prompt = generate_prompt(text)
+    with upstream_seconds.time(kind="single"):
+        response = upstream.apply(model.generate_content, prompt)
+    record_usage("single", response)
+    return response.text
+
+def request_batch_translation(texts):
+    """Sends several texts to the model as one structured-output call."""
+    prompt = generate_batch_prompt(texts)
+    generation_config = {
+        "response_mime_type": "application/json",
+        "response_schema": list[str],
+    }
+    with upstream_seconds.time(kind="batch"):
+        response = upstream.apply(batch_model.generate_content, prompt, generation_config=generation_config)
+    record_usage("batch", response)
     try:
-        response = model.generate_content(prompt)
-        translation = response.text
-        return convert_pinyin_to_english(translation)
+        return json.loads(response.text)
+    except json.JSONDecodeError:
+        # Let the batcher fall back to per-item calls
+        return None
+
+def stream_translation(text):
+    """Streams the raw translation of a single text from the model as it is generated."""
+    prompt = generate_prompt(text)
+
+    def chunks():
+        chunk = None
+        for chunk in model.generate_content(prompt, stream=True):
+            try:
+                yield chunk.text
+            except ValueError:
+                # Chunks without text parts, e.g. the final one carrying the finish reason
+                continue
+        # The last chunk reports the usage of the whole call
+        record_usage("stream", chunk)
+
+    return upstream.iterate(chunks)
+
+# Short texts arriving close together are translated in one upstream call
+batcher = TranslationBatcher(
+    request_batch_translation,
+    request_translation,
+    max_batch_size=int(os.getenv("TRANSLATION_BATCH_SIZE", "16")),
+    max_wait=float(os.getenv("TRANSLATION_BATCH_WAIT_MS", "5")) / 1000,
+)
+
+def handle_translation(text, cache_key=None, context=None):
+    """Handles the translation of the input text, returning ``(translation, outcome)``."""
+    return translate_text_with_outcome(unquote(text), cache_key, context)
+
+def translate_text(text, cache_key=None, context=None):
+    """Translates already decoded text through the glossary, cache, batcher and model.
+
+    ``cache_key`` and ``context`` are computed when the caller doesn't pass
+    them; each costs a glossary scan, so callers that have them pass them on.
+    """
+    return translate_text_with_outcome(text, cache_key, context)[0]
+
+def translate_text_with_outcome(text, cache_key=None, context=None):
+    """Like ``translate_text``, but returns ``(translation, outcome)``.
+
+    The outcome says where the translation came from: ``glossary``,
+    ``cached``, ``remembered`` or ``translated``, or ``failed`` with
+    ``False`` as the translation. Every single-flight call on a translation
+    key runs this, so all callers sharing a flight get the same shape.
+    """
+    term = glossary.lookup(text)
+    if term is not None:
+        return term, "glossary"
+
+    context = context or translation_context(text)
+    cache_key = cache_key or translation_key(text, context)
+    with span("cache"):
+        cached = cache.get(cache_key)
+    if cached is not None:
+        return cached, "cached"
+
+    with span("memory"):
+        remembered = memory.lookup(text, context)
+    if remembered is not None:
+        cache.set(cache_key, remembered)
+        return remembered, "remembered"
+
+    try:
+        # Includes the wait for other texts to batch with
+        with span("model"):
+            raw = batcher.submit(text)
+        translation = convert_pinyin_to_english(raw)
+        cache.set(cache_key, translation)
+        glossary.harvest(text, translation)
+        memory.add(text, translation, context)
+        return translation, "translated"
+    except (Overloaded, CircuitOpen):
+        raise
     except Exception as e:
-        print(f"There was a problem with the request! Error message: {e}")
-        logging.error(f"There was a problem with the request! Error message: {e}")
-        return False
+        record_error(e, "There was a problem with the request! Error message")
+        return False, "failed"
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    g.trace = start_trace(request.path, TRANSLATION_TRACE_SAMPLE)
+    in_flight.inc()
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    seconds = time.perf_counter() - g.started
+    request_seconds.observe(seconds, endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if request_listeners:
+        event = {
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "seconds": seconds,
+            "text": request.args.get("text"),
+            "translation": response.get_data(as_text=True) if endpoint == "/translate" else None,
+        }
+        for listener in request_listeners:
+            listener(event)
+    if g.trace is not None:
+        response.headers["Server-Timing"] = g.trace.server_timing()
+        logging.info(g.trace.summary())
+    return response
+
+@app.teardown_request
+def end_request(_error=None):
+    in_flight.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/translate', methods=['GET'])
 def translate():
     """API endpoint for text translation."""
     text = request.args.get('text')
-    print(f"Received Text: {text}")
-    logging.info(f"Received Text: {text}")
 
-    with ThreadPoolExecutor() as executor:
+    try:
+        context = translation_context(unquote(text))
+        cache_key = translation_key(unquote(text), context)
+        translation, _ = inflight.do(cache_key, handle_translation, text, cache_key, context)
+        if translation:
+            log_sampled("Translated %r -> %r", text, translation)
+            return translation
+        else:
+            return "Translation failed", 500
+    except Overloaded as e:
+        errors_total.inc(type=type(e).__name__)
+        logging.warning(f"Rejected translation: {e}")
+        return "Translator overloaded", 503
+    except CircuitOpen as e:
+        errors_total.inc(type=type(e).__name__)
+        logging.warning(f"Rejected translation: {e}")
+        return "Translator unavailable", 503, {"Retry-After": str(int(e.retry_after) + 1)}
+    except Exception as e:
+        record_error(e, "Error during translation")
+        return "Translation failed", 500
+
+# Tone-marked vowels and ü mapped to plain letters, applied in a single str.translate pass
+TONE_MARK_TABLE = str.maketrans({
+    'ü': 'u',
+    'ā': 'a', 'á': 'a', 'ǎ': 'a', 'à': 'a',
+    'ē': 'e', 'é': 'e', 'ě': 'e', 'è': 'e',
+    'ī': 'i', 'í': 'i', 'ǐ': 'i', 'ì': 'i',
+    'ō': 'o', 'ó': 'o', 'ǒ': 'o', 'ò': 'o',
+    'ū': 'u', 'ú': 'u', 'ǔ': 'u', 'ù': 'u',
+    'ǖ': 'u', 'ǘ': 'u', 'ǚ': 'u', 'ǜ': 'u',
+})
+
+# Superset of the Han ranges pypinyin converts; text without a match is returned by it unchanged
+HAN_PATTERN = re.compile('[\u2e80-\u9fff\ue815-\ue864\uf900-\ufaff\U00020000-\U0003ffff]')
+
+@app.route('/translate/stream', methods=['GET'])
+def translate_stream():
+    """API endpoint that streams the translation as the model generates it."""
+    text = request.args.get('text')
+    log_sampled("Received text (stream): %r", text)
+
+    try:
+        text = unquote(text)
+        cached = glossary.lookup(text)
+        if cached is None:
+            context = translation_context(text)
+            cache_key = translation_key(text, context)
+            cached = cache.get(cache_key)
+        if cached is None:
+            cached = memory.lookup(text, context)
+        if cached is not None:
+            return Response(cached, mimetype='text/plain')
+
+        parts = convert_pinyin_stream(stream_translation(text))
+        # Wait for the first chunk so failures before any output still get a status code
+        first = next(parts, '')
+    except Overloaded as e:
+        errors_total.inc(type=type(e).__name__)
+        logging.warning(f"Rejected translation: {e}")
+        return "Translator overloaded", 503
+    except CircuitOpen as e:
+        errors_total.inc(type=type(e).__name__)
+        logging.warning(f"Rejected translation: {e}")
+        return "Translator unavailable", 503, {"Retry-After": str(int(e.retry_after) + 1)}
+    except Exception as e:
+        record_error(e, "Error during streamed translation")
+        return "Translation failed", 500
+
+    def generate():
+        translation = [first]
+        yield first
         try:
-            translation = executor.submit(handle_translation, text).result()
-            if translation:
-                print(f"Translated Text: {translation}")
-                logging.info(f"Translation Response: {translation}")
-                return translation
-            else:
-                return "Translation failed", 500
+            for part in parts:
+                translation.append(part)
+                yield part
         except Exception as e:
-            print(f"Error during translation: {e}")
-            logging.info(f"Error during translation: {e}")
-            return "Translation failed", 500
+            # Headers are already sent, so the client only sees a truncated body
+            record_error(e, "Streamed translation interrupted")
+            return
+        translation = ''.join(translation)
+        cache.set(cache_key, translation)
+        glossary.harvest(text, translation)
+        memory.add(text, translation, context)
+
+    return Response(generate(), mimetype='text/plain')
+
+def parse_batch_request(body, content_type):
+    """Parses a bulk request body into (id, text, error) entries.
+
+    The body is either a JSON array or NDJSON (one JSON value per line). Each
+    entry is a string or an object with a "text" field and an optional "id";
+    ids default to the entry's position. Malformed entries get an error
+    instead of a text so they don't abort the rest of the batch.
+    """
+    if content_type.startswith('application/json'):
+        values = json.loads(body)
+        if not isinstance(values, list):
+            raise ValueError("Expected a JSON array")
+    else:
+        values = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                values.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                values.append(ValueError(f"Invalid JSON: {e}"))
+
+    entries = []
+    for index, value in enumerate(values):
+        if isinstance(value, str):
+            entries.append((index, value, None))
+        elif isinstance(value, dict) and isinstance(value.get('text'), str):
+            entries.append((value.get('id', index), value['text'], None))
+        elif isinstance(value, Exception):
+            entries.append((index, None, str(value)))
+        else:
+            entries.append((index, None, 'Expected a string or an object with a "text" field'))
+    return entries
+
+def translate_bulk_item(text):
+    """Translates one text of a bulk request, returning ``(translation or None, outcome)``."""
+    try:
+        context = translation_context(text)
+        cache_key = translation_key(text, context)
+        translation, outcome = inflight.do(cache_key, translate_text_with_outcome, text, cache_key, context)
+        return translation or None, outcome
+    except Exception as e:
+        record_error(e, f"Bulk translation failed for {text!r}")
+        return None, "failed"
+
+@app.route('/translate/batch', methods=['POST'])
+def translate_batch():
+    """API endpoint that translates many texts, streaming NDJSON results in input order."""
+    try:
+        entries = parse_batch_request(request.get_data(as_text=True), request.content_type or '')
+    except ValueError as e:
+        return f"Invalid batch request: {e}", 400
+    logging.info(f"Received batch of {len(entries)} texts")
+
+    # Each distinct text is translated once, by at most BULK_CONCURRENCY greenlets at a time
+    pool = Pool(BULK_CONCURRENCY)
+    tasks = {}
+    ordered = Queue()
+
+    def schedule():
+        for entry_id, text, error in entries:
+            if error is None and text not in tasks:
+                tasks[text] = pool.spawn(translate_bulk_item, text)
+            ordered.put((entry_id, text, error))
+        ordered.put(StopIteration)
+
+    scheduler = gevent.spawn(schedule)
+
+    def generate():
+        try:
+            for entry_id, text, error in ordered:
+                result = {'id': entry_id}
+                translation = tasks[text].get()[0] if error is None else None
+                if translation:
+                    result['translation'] = translation
+                else:
+                    result['error'] = error or 'Translation failed'
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+        finally:
+            # Stop scheduling work for a client that went away. Texts already
+            # started finish, since /translate requests may be waiting on them
+            scheduler.kill(block=False)
+
+    return Response(generate(), mimetype='application/x-ndjson')
 
 def convert_pinyin_to_english(pinyin):
     """Converts Pinyin characters to English equivalents."""
-    english = pypinyin.pinyin(pinyin, style=pypinyin.NORMAL)
-    english = ''.join([i[0] for i in english])
-
-    pinyin_to_english_map = {
-        'ü': 'u',
-        'üe': 'ue',
-        'üi': 'ui',
-        'üo': 'uo',
-        'üa': 'ua',
-        'üe': 'ue',
-        'üai': 'uai',
-        'üao': 'uao',
-        'üan': 'uan',
-        'üang': 'uang',
-        'üe': 'ue',
-        'üei': 'uei',
-        'üo': 'uo',
-        'üai': 'uai',
-        'üao': 'uao',
-        'üan': 'uan',
-        'üang': 'uang',
-        'ā': 'a',
-        'ǎ': 'a',
-        'à': 'a',
-        'á': 'a',
-        'ē': 'e',
-        'ě': 'e',
-        'è': 'e',
-        'é': 'e',
-        'ī': 'i',
-        'ǐ': 'i',
-        'ì': 'i',
-        'í': 'i',
-        'ō': 'o',
-        'ǒ': 'o',
-        'ò': 'o',
-        'ó': 'o',
-        'ū': 'u',
-        'ǔ': 'u',
-        'ù': 'u',
-        'ú': 'u',
-        'ǖ': 'u',
-        'ǘ': 'u',
-        'ǚ': 'u',
-        'ǜ': 'u',
-        'āi': 'ai',
-        'ǎi': 'ai',
-        'ài': 'ai',
-        'ái': 'ai',
-        'ēi': 'ei',
-        'ěi': 'ei',
-        'èi': 'ei',
-        'éi': 'ei',
-        'īi': 'ii',
-        'ǐi': 'ii',
-        'ìi': 'ii',
-        'íi': 'ii',
-        'ōi': 'oi',
-        'ǒi': 'oi',
-        'òi': 'oi',
-        'ói': 'oi',
-        'ūi': 'ui',
-        'ǔi': 'ui',
-        'ùi': 'ui',
-        'úi': 'ui',
-        'ǖi': 'ui',
-        'ǘi': 'ui',
-        'ǚi': 'ui',
-        'ǜi': 'ui',
-        'āu': 'au',
-        'ǎu': 'au',
-        'àu': 'au',
-        'áu': 'au',
-        'ēu': 'eu',
-        'ěu': 'eu',
-        'èu': 'eu',
-        'éu': 'eu',
-        'īu': 'iu',
-        'ǐu': 'iu',
-        'ìu': 'iu',
-        'íu': 'iu',
-        'ōu': 'ou',
-        'ǒu': 'ou',
-        'òu': 'ou',
-        'óu': 'ou',
-        'ūu': 'uu',
-        'ǔu': 'uu',
-        'ùu': 'uu',
-        'úu': 'uu',
-        'ǖu': 'uu',
-        'ǘu': 'uu',
-        'ǚu': 'uu',
-        'ǜu': 'uu',
-        'āng': 'ang',
-        'ǎng': 'ang',
-        'àng': 'ang',
-        'áng': 'ang',
-        'ēng': 'eng',
-        'ěng': 'eng',
-        'èng': 'eng',
-        'éng': 'eng',
-        'īng': 'ing',
-        'ǐng': 'ing',
-        'ìng': 'ing',
-        'íng': 'ing',
-        'ōng': 'ong',
-        'ǒng': 'ong',
-        'òng': 'ong',
-        'óng': 'ong',
-        'ūng': 'ung',
-        'ǔng': 'ung',
-        'ùng': 'ung',
-        'úng': 'ung',
-        'ǖng': 'ung',
-        'ǘng': 'ung',
-        'ǚng': 'ung',
-        'ǜng': 'ung',
-        'ān': 'an',
-        'ǎn': 'an',
-        'àn': 'an',
-        'án': 'an',
-        'ēn': 'en',
-        'ěn': 'en',
-        'èn': 'en',
-        'én': 'en',
-        'īn': 'in',
-        'ǐn': 'in',
-        'ìn': 'in',
-        'ín': 'in',
-        'ōn': 'on',
-        'ǒn': 'on',
-        'òn': 'on',
-        'ón': 'on',
-        'ūn': 'un',
-        'ǔn': 'un',
-        'ùn': 'un',
-        'ún': 'un',
-        'ǖn': 'un',
-        'ǘn': 'un',
-        'ǚn': 'un',
-        'ǜn': 'un',
-        'āng': 'ang',
-        'ǎng': 'ang',
-        'àng': 'ang',
-        'áng': 'ang',
-        'ēng': 'eng',
-        'ěng': 'eng',
-        'èng': 'eng',
-        'éng': 'eng',
-        'īng': 'ing',
-        'ǐng': 'ing',
-        'ìng': 'ing',
-        'íng': 'ing',
-        'ōng': 'ong',
-        'ǒng': 'ong',
-        'òng': 'ong',
-        'óng': 'ong',
-        'ūng': 'ung',
-        'ǔng': 'ung',
-        'ùng': 'ung',
-        'úng': 'ung',
-        'ǖng': 'ung',
-        'ǘng': 'ung',
-        'ǚng': 'ung',
-        'ǜng': 'ung',
-    }
+    with pinyin_seconds.time(), span("pinyin"):
+        english = pinyin
+        if HAN_PATTERN.search(english):
+            english = ''.join([i[0] for i in pypinyin.pinyin(english, style=pypinyin.NORMAL)])
+
+        return english.translate(TONE_MARK_TABLE)
+
+# A run of Han characters at the end of a chunk may continue in the next one
+HAN_TAIL_PATTERN = re.compile(HAN_PATTERN.pattern + '+$')
 
-    for pinyin_char, english_char in pinyin_to_english_map.items():
-        english = english.replace(pinyin_char, english_char)
+def convert_pinyin_stream(chunks):
+    """Applies convert_pinyin_to_english to streamed chunks as they arrive.
 
-    return english
+    Trailing Han characters are held back until the next chunk so that words
+    split across chunks are converted together.
+    """
+    pending = ''
+    for chunk in chunks:
+        text = pending + chunk
+        tail = HAN_TAIL_PATTERN.search(text)
+        cut = tail.start() if tail else len(text)
+        pending = text[cut:]
+        if cut:
+            yield convert_pinyin_to_english(text[:cut])
+    if pending:
+        yield convert_pinyin_to_english(pending)
 
-def run_translation():
+def configure_logging():
+    """Sends log records through a queue to a background thread.
+
+    Request handlers then only enqueue records and never wait on stderr.
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(records)]
+    root.setLevel(TRANSLATION_LOG_LEVEL)
+    log_listener = QueueListener(records, handler, respect_handler_level=True)
+    log_listener.start()
+
+def run_translation(host=None, port=None, server=None, workers=None):
+    """Runs the translation server in the configured mode until it is stopped."""
+    global http_server
+    host = host or TRANSLATION_HOST
+    port = port or TRANSLATION_PORT
+    server = server or TRANSLATION_SERVER
+
+    if server == "asgi":
+        # Imported here so the gevent mode never loads the ASGI stack
+        from asgi_translator import run_async_translation
+        run_async_translation(host, port, workers or TRANSLATION_WORKERS)
+        return
+    if server != "gevent":
+        raise ValueError(f"Unknown translation server mode: {server}")
+
+    workers = workers or TRANSLATION_WORKERS
+    if workers > 1:
+        print(f"Server starting at http://{host}:{port} with {workers} workers")
+        # Each worker has its own upstream guard; split the rate budgets between them
+        os.environ["UPSTREAM_PROCESSES"] = str(workers)
+        run_prefork(serve_worker, host, port, workers, stop_timeout=TRANSLATION_DRAIN_TIMEOUT + 5)
+        return
+
+    print(f"Server starting at http://{host}:{port}")
+    serve((host, port))
+
+def serve(listener):
+    """Serves the app on ``listener`` (an address or a listening socket) until stopped."""
     global http_server
-    print("Server starting at http://127.0.0.1:4000")
-    http_server = WSGIServer(('127.0.0.1', 4000), app, log=None, error_log=None)
-    http_server.serve_forever()
-    
+    configure_logging()
+    # Handlers run in a pool so that stopping can wait for the ones in flight
+    http_server = WSGIServer(listener, app, log=None, error_log=None, spawn=Pool())
+    http_server.serve_forever(stop_timeout=TRANSLATION_DRAIN_TIMEOUT)
+
+def serve_worker(listener, host, port):
+    """Runs one worker process of the pre-fork mode.
+
+    ``listener`` is the socket shared by all workers, or ``None`` to bind an
+    own SO_REUSEPORT socket. Workers share the SQLite tier of the cache, so
+    a text translated by one is a disk hit for the others.
+    """
+    # Ctrl+C reaches every process of the group; the master stops the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if os.name == "posix":
+        gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(stop_translation))
+    serve(listener or listen(host, port, reuse_port=True))
+
 def stop_translation():
     global http_server
     if http_server:
         print("Stopping the server...")
-        http_server.stop()
+        http_server.stop(timeout=TRANSLATION_DRAIN_TIMEOUT)
         print("Server stopped.")
+    if log_listener:
+        # Flushes the records still queued
+        log_listener.stop()
 
 if __name__ == "__main__":
-    run_translation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the XUnity translation server.")
+    parser.add_argument("--server", choices=["gevent", "asgi"], default=TRANSLATION_SERVER)
+    parser.add_argument("--host", default=TRANSLATION_HOST)
+    parser.add_argument("--port", type=int, default=TRANSLATION_PORT)
+    parser.add_argument("--workers", type=int, default=TRANSLATION_WORKERS, help="worker processes sharing the port")
+    args = parser.parse_args()
+    run_translation(args.host, args.port, args.server, args.workers)
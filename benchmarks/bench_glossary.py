@@ -0,0 +1,52 @@
+"""Benchmark for the glossary's Aho-Corasick index against checking every term.
+
+Builds a glossary of random Han terms, then finds the terms occurring in
+game-like lines with the automaton and with ``term in text`` for every
+term, checks both agree and reports the time per line:
+
+    python -m benchmarks.bench_glossary --terms 20000 --lines 2000
+"""
+import time
+import random
+import argparse
+
+from glossary import AhoCorasick
+
+# Common characters of game text, so terms and lines share enough of them to match
+CHARACTERS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏剑刀枪丹药龙凤虎山河城门客栈掌柜仙魔妖兽师父"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--line-chars", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    terms = {"".join(rng.choices(CHARACTERS, k=rng.randint(2, 5))) for _ in range(args.terms)}
+    lines = ["".join(rng.choices(CHARACTERS, k=args.line_chars)) for _ in range(args.lines)]
+
+    started = time.perf_counter()
+    automaton = AhoCorasick(terms)
+    build = time.perf_counter() - started
+    print(f"{len(terms)} terms, automaton built in {build * 1000:.0f} ms")
+
+    started = time.perf_counter()
+    found = [{word for _, word in automaton.find(line)} for line in lines]
+    indexed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = [{term for term in terms if term in line} for line in lines]
+    scanned = time.perf_counter() - started
+
+    assert found == expected, "automaton and scan disagree"
+    matches = sum(len(words) for words in found) / len(lines)
+    print(f"{matches:.1f} terms per line on average")
+    print(f"automaton: {indexed / len(lines) * 1e6:8.1f} us per line")
+    print(f"scan:      {scanned / len(lines) * 1e6:8.1f} us per line ({scanned / indexed:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
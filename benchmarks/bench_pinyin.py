@@ -0,0 +1,23 @@
+"""Micro-benchmark for convert_pinyin_to_english.
+
+Times the single-pass implementation in auto_translator against the
+original replace-loop version on a mixed corpus. Their equivalence is
+checked by tests/test_pinyin.py. Run from the repository root:
+
+    python -m benchmarks.bench_pinyin
+"""
+import timeit
+
+from auto_translator import convert_pinyin_to_english
+from tests.test_pinyin import CORPUS, legacy_convert_pinyin_to_english, random_corpus
+
+
+def main():
+    corpus = CORPUS + random_corpus(2000)
+    for name, fn in (("legacy", legacy_convert_pinyin_to_english), ("single-pass", convert_pinyin_to_english)):
+        seconds = min(timeit.repeat(lambda: [fn(text) for text in corpus], number=1, repeat=5))
+        print(f"{name:>12}: {seconds / len(corpus) * 1e6:8.2f} us/text")
+
+
+if __name__ == "__main__":
+    main()
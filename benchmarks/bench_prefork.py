@@ -0,0 +1,64 @@
+"""Throughput of the pre-fork gevent mode at increasing worker counts.
+
+Starts the translator with each ``--workers`` count in turn, on a fresh
+SQLite cache shared by its workers, and runs the same keep-alive load
+against it after a warm-up. Reports throughput, latency, the speedup over
+one worker and the upstream calls counted by the stub model server:
+
+    python -m benchmarks.bench_prefork --workers 1 2 4 --connections 200
+
+Throughput can only scale up to the number of CPU cores, which is printed
+with the results.
+"""
+import os
+import random
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.load_test import free_port, run_load, start_stub_server, start_translator, stop_process, stub_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--latency-ms", type=float, default=20, help="stub model latency")
+    parser.add_argument("--unique-texts", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Han text, so misses also pay for the Pinyin pass over the echoed answer
+    texts = [f"测试文本第{i}行，小心前方有妖兽出没" for i in range(args.unique_texts)]
+    env = {"TRANSLATION_MAX_CONCURRENCY": "64", "TRANSLATION_MAX_QUEUE": "100000"}
+    stub_port = free_port()
+    stub = start_stub_server(stub_port, args.latency_ms)
+    print(f"{os.cpu_count()} CPU cores")
+    baseline = None
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as directory:
+                port = free_port()
+                cache_env = dict(env, TRANSLATION_CACHE_PATH=os.path.join(directory, "cache.db"))
+                translator = start_translator("gevent", port, stub_port, env=cache_env, args=["--workers", str(workers)])
+                try:
+                    # Every worker loads the Gemini SDK on its first request; keep that out of the measurement
+                    asyncio.run(run_load(port, lambda: random.choice(texts), args.connections, args.warmup))
+                    calls_before = stub_calls(stub_port)
+                    stats = asyncio.run(run_load(port, lambda: random.choice(texts), args.connections, args.duration))
+                finally:
+                    stop_process(translator)
+            upstream_calls = stub_calls(stub_port) - calls_before
+            baseline = baseline or stats["throughput_rps"]
+            print(
+                f"{workers:>3} workers: {stats['throughput_rps']:.0f} req/s ({stats['throughput_rps'] / baseline:.2f}x), "
+                f"p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, errors {stats['error_rate']:.1%}, "
+                f"{upstream_calls} upstream calls"
+            )
+    finally:
+        stop_process(stub)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark of PIL-to-QImage conversion for generated images.
+
+Compares the original PNG round trip (encode to PNG, decode with Qt, scale)
+with the raw-buffer path in qt_images on 1024x1365 images, the size of a
+3:4 Imagen result, for both full-size conversion and thumbnails:
+
+    python -m benchmarks.bench_qimage
+"""
+import timeit
+import argparse
+
+from io import BytesIO
+
+from PIL import Image
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage
+
+from qt_images import THUMBNAIL_SIZE, pil_to_qimage, render_thumbnail, thumbnail_cache
+
+
+def legacy_pil_to_qimage(pil_image):
+    """The original conversion: a full PNG encode and decode."""
+    bytes_io = BytesIO()
+    pil_image.save(bytes_io, format='PNG')
+    image = QImage()
+    image.loadFromData(bytes_io.getvalue())
+    return image
+
+
+def legacy_thumbnail(pil_image):
+    return legacy_pil_to_qimage(pil_image).scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def make_images(count, width, height):
+    """Builds noisy RGB test images, which compress like real photos."""
+    return [Image.effect_noise((width, height), 64 + index).convert("RGB") for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=4)
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=1365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    images = make_images(args.count, args.width, args.height)
+
+    # The new path must show the same pixels as the PNG round trip
+    for image in images:
+        assert pil_to_qimage(image).convertToFormat(QImage.Format_RGB32) == legacy_pil_to_qimage(image).convertToFormat(QImage.Format_RGB32)
+
+    cases = [
+        ("full size, PNG round trip", legacy_pil_to_qimage),
+        ("full size, raw buffer", pil_to_qimage),
+        ("thumbnail, PNG round trip", legacy_thumbnail),
+        ("thumbnail, raw buffer", render_thumbnail),
+        ("thumbnail, cached", thumbnail_cache.get),
+    ]
+    print(f"{args.count} images of {args.width}x{args.height}")
+    for name, convert in cases:
+        seconds = min(timeit.repeat(lambda: [convert(image) for image in images], number=1, repeat=args.repeat))
+        print(f"{name:>26}: {seconds / len(images) * 1000:8.2f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark for near-duplicate lookups in the perceptual-hash recipe cache.
+
+Fills the multi-index hash table with random 64-bit hashes and compares lookups within the
+configured Hamming distance against a linear scan, for hits (a cached hash
+with a few bits flipped) and misses (fresh random hashes):
+
+    python -m benchmarks.bench_recipe_cache --entries 100000 --distance 6
+"""
+import time
+import random
+import argparse
+
+from recipe_cache import MultiIndexHash, hamming_distance
+
+
+def linear_search(hashes, value, max_distance):
+    """Returns the index of the nearest hash within ``max_distance``, scanning all of them."""
+    best = None
+    for index, candidate in enumerate(hashes):
+        distance = hamming_distance(value, candidate)
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, index)
+    return best
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def time_lookups(lookup, queries):
+    started = time.perf_counter()
+    results = [lookup(query) for query in queries]
+    return (time.perf_counter() - started) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--distance", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(64) for _ in range(args.entries)]
+
+    started = time.perf_counter()
+    index_table = MultiIndexHash(args.distance)
+    for index, value in enumerate(hashes):
+        index_table.add(value, index)
+    print(f"Built index of {args.entries} hashes in {time.perf_counter() - started:.2f}s")
+
+    hits = [flip_bits(rng.choice(hashes), rng.randint(0, args.distance), rng) for _ in range(args.queries)]
+    misses = [rng.getrandbits(64) for _ in range(args.queries)]
+
+    for name, queries in (("hit", hits), ("miss", misses)):
+        index_time, index_results = time_lookups(lambda q: index_table.search(q)[:1], queries)
+        scan_time, scan_results = time_lookups(lambda q: linear_search(hashes, q, args.distance), queries)
+        # Both must agree on the distance of the nearest match
+        for found, expected in zip(index_results, scan_results):
+            assert (found[0][0] if found else None) == (expected[0] if expected else None)
+        print(
+            f"{name:>4}: index {index_time * 1000:.3f} ms, linear scan {scan_time * 1000:.2f} ms "
+            f"per lookup ({scan_time / index_time:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
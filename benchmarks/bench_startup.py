@@ -0,0 +1,102 @@
+"""Startup benchmark for the GUI: import time and time to first window.
+
+Runs ``python -X importtime -c "import main"`` and reports the slowest
+top-level packages by self time, then starts the app in fresh interpreters
+until its window is shown and compares the median against a target:
+
+    python -m benchmarks.bench_startup --runs 5 --target-ms 800
+
+Qt uses the offscreen platform unless QT_QPA_PLATFORM is already set. The
+exit status is non-zero when the median time to first window misses the
+target.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from collections import Counter
+
+from benchmarks.load_test import REPO_ROOT
+
+# Modules that should only load once the feature needing them is used
+DEFERRED_MODULES = ["google.generativeai", "flask", "gevent", "pypinyin"]
+
+FIRST_WINDOW_SCRIPT = """
+import sys
+from PySide6.QtWidgets import QApplication
+import main
+app = QApplication(sys.argv)
+window = main.GeneratorApp()
+window.show()
+app.processEvents()
+loaded = [name for name in {deferred!r} if name in sys.modules]
+print("shown", ",".join(loaded), flush=True)
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return env
+
+
+def import_times():
+    """Returns ``(total_seconds, Counter of self seconds per top-level package)`` for ``import main``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=REPO_ROOT, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    packages = Counter()
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+        if name.strip() == "main":
+            total = int(cumulative_us) / 1e6
+    return total, packages
+
+
+def time_to_first_window():
+    """Starts the app in a new interpreter; returns the seconds until its window is shown and the deferred modules it loaded."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_WINDOW_SCRIPT.format(deferred=DEFERRED_MODULES)],
+        cwd=REPO_ROOT, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - started
+    line = next(line for line in result.stdout.splitlines() if line.startswith("shown"))
+    loaded = line[len("shown"):].strip()
+    return elapsed, loaded.split(",") if loaded else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="packages to list in the import report")
+    parser.add_argument("--target-ms", type=float, default=800, help="target median time to first window")
+    args = parser.parse_args()
+
+    total, packages = import_times()
+    print(f"import main: {total * 1000:.0f} ms")
+    for name, seconds in packages.most_common(args.top):
+        print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, loaded = time_to_first_window()
+        timings.append(elapsed)
+    median = statistics.median(timings)
+    print(f"time to first window: median {median * 1000:.0f} ms over {args.runs} runs (target {args.target_ms:.0f} ms)")
+    if loaded:
+        print(f"loaded before the first window: {', '.join(loaded)}")
+
+    sys.exit(0 if median * 1000 <= args.target_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Reproducible benchmark for the /translate endpoint.
+
+Replays a corpus of game strings against the translator, with repeats drawn
+from a Zipf distribution like real game UIs produce, and with the model layer
+served by the stub model server. Two phases are run:
+
+- fixed rate: open-loop requests at ``--rate`` per second, with latency
+  measured from each request's scheduled start
+- ramp: closed-loop keep-alive clients at increasing concurrency
+
+Each phase reports p50/p95/p99 latency, throughput, error rate and the number
+of upstream model calls. Results are written as JSON so runs can be compared
+across commits:
+
+    python -m benchmarks.bench_translate --output bench_translate.json
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+
+from urllib.parse import quote
+
+from benchmarks.load_test import (
+    REPO_ROOT, free_port, request, run_load, start_stub_server, start_translator,
+    stop_process, stub_calls, summarize,
+)
+
+# Menus, item names, NPC barks and dialogue lines of mixed length
+GAME_STRINGS = [
+    "开始游戏", "继续", "设置", "退出", "确定", "取消", "返回", "保存", "读取", "背包",
+    "装备", "技能", "任务", "地图", "商店", "锻造", "强化", "出售", "购买", "使用",
+    "生命值", "法力值", "攻击力", "防御力", "暴击率", "闪避", "经验值", "等级提升！",
+    "铁剑", "青龙偃月刀", "回春丹", "九转还魂丹", "精铁矿石", "灵兽蛋", "龙鳞甲", "玄冰护符",
+    "你好，旅行者。", "小心，前方有妖兽出没！", "这把剑是我祖传的宝物。",
+    "掌柜的，来两斤牛肉！", "客官，里面请。", "天色已晚，早些休息吧。",
+    "获得 3 金币", "获得 12 金币", "背包已满，无法拾取物品。", "金币不足，无法购买。",
+    "任务完成：寻找失踪的村民", "新任务：前往青云山拜见掌门",
+    "师父曾说过，修行之路漫长而艰辛，唯有坚持本心，方能得道。",
+    "传说在遥远的东海之上，有一座仙岛，岛上住着长生不老的仙人。若能寻得仙岛，便可求得长生之法。",
+    "你确定要放弃当前任务吗？放弃后所有进度将会丢失。",
+    "敌人的攻击太强了，我们必须先撤退，再从长计议。",
+    "<color=#ffcc00>稀有</color>", "<b>警告</b>：生命值过低", "按 {0} 键打开背包",
+    "第一章：初入江湖", "第二章：风云再起", "第三章：问鼎天下",
+    "李逍遥", "赵灵儿", "林月如", "张无忌", "令狐冲", "黄蓉",
+]
+
+
+def load_corpus(path=None):
+    """Returns the benchmark corpus, from ``path`` (one string per line) or built in."""
+    if not path:
+        return list(GAME_STRINGS)
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def zipf_sampler(corpus, exponent, seed):
+    """Returns a function drawing strings so that rank ``k`` has weight ``1 / k**exponent``."""
+    rng = random.Random(seed)
+    ranked = list(corpus)
+    rng.shuffle(ranked)
+    cumulative = []
+    total = 0.0
+    for rank in range(1, len(ranked) + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return lambda: rng.choices(ranked, cum_weights=cumulative)[0]
+
+
+async def run_fixed_rate(port, next_text, rate, duration):
+    """Sends requests at ``rate`` per second for ``duration`` seconds, open-loop."""
+    idle = []
+    results = []
+
+    async def send(scheduled):
+        if idle:
+            reader, writer = idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            status, _ = await request(reader, writer, "/translate?text=" + quote(next_text()))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            status = None
+        else:
+            idle.append((reader, writer))
+        results.append((time.perf_counter() - scheduled, status))
+
+    started = time.perf_counter()
+    tasks = []
+    for index in range(int(rate * duration)):
+        scheduled = started + index / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(scheduled)))
+    await asyncio.gather(*tasks)
+    for _, writer in idle:
+        writer.close()
+    return summarize(results, time.perf_counter() - started)
+
+
+def measure(stub_port, phase):
+    """Runs ``phase`` and adds the upstream calls it caused to its stats."""
+    calls_before = stub_calls(stub_port)
+    stats = asyncio.run(phase)
+    stats["upstream_calls"] = stub_calls(stub_port) - calls_before
+    return stats
+
+
+def git_commit():
+    """Returns the current commit hash, or ``None`` outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["gevent", "asgi"], default="gevent")
+    parser.add_argument("--corpus", help="file with one source string per line (default: built-in game strings)")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of string repeats")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub model latency")
+    parser.add_argument("--rate", type=float, default=200, help="requests per second in the fixed-rate phase")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase or ramp step")
+    parser.add_argument("--ramp", type=int, nargs="+", default=[1, 8, 32, 128, 512], help="concurrency levels of the ramp phase")
+    parser.add_argument("--output", default="bench_translate.json")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {**vars(args), "corpus_size": len(corpus)},
+        "fixed_rate": None,
+        "ramp": [],
+    }
+
+    stub_port = free_port()
+    stub = start_stub_server(stub_port, args.latency_ms)
+    try:
+        # A fresh translator per phase keeps its in-memory cache cold at the start
+        port = free_port()
+        translator = start_translator(args.server, port, stub_port)
+        try:
+            next_text = zipf_sampler(corpus, args.zipf, args.seed)
+            results["fixed_rate"] = measure(stub_port, run_fixed_rate(port, next_text, args.rate, args.duration))
+        finally:
+            stop_process(translator)
+        print(f"fixed rate {args.rate:g}/s: {json.dumps(results['fixed_rate'])}")
+
+        for concurrency in args.ramp:
+            port = free_port()
+            translator = start_translator(args.server, port, stub_port)
+            try:
+                next_text = zipf_sampler(corpus, args.zipf, args.seed)
+                stats = measure(stub_port, run_load(port, next_text, concurrency, args.duration))
+            finally:
+                stop_process(translator)
+            stats["concurrency"] = concurrency
+            results["ramp"].append(stats)
+            print(f"concurrency {concurrency}: {json.dumps(stats)}")
+    finally:
+        stop_process(stub)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
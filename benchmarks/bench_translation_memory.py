@@ -0,0 +1,121 @@
+"""Upstream calls saved by the template translation memory on a text dump.
+
+Replays the distinct source lines of a dump in order, as the translator
+would see them with an exact-match cache in front. Each line is answered
+from the translation memory when it can be, and from a stand-in model
+otherwise. The stand-in converts Han characters to Pinyin and keeps
+numbers and tags, so answers built from templates can be checked against
+it. The dump is either an XUnity ``_AutoGeneratedTranslations.txt`` file
+(``source=translation`` lines) or one source line per line; without one,
+game-like lines with varying numbers and tags are generated:
+
+    python -m benchmarks.bench_translation_memory --dump _AutoGeneratedTranslations.txt
+
+Reports the model calls with the exact cache alone and with the memory,
+for template matches only and with fuzzy reuse at ``--reuse`` similarity.
+Fuzzy answers that differ from the stand-in's are counted as mismatches.
+"""
+import random
+import argparse
+
+from auto_translator import convert_pinyin_to_english
+from benchmarks.bench_translate import GAME_STRINGS
+from translation_memory import TranslationMemory
+
+# Lines of a game UI that vary only in their numbers, placeholders or tags
+TEMPLATES = [
+    "获得 {n} 金币", "获得 {n} 经验值", "消耗 {n} 点法力值", "第{n}层", "第{n}章：初入江湖",
+    "剩余时间：{n}分{m}秒", "等级 {n}", "攻击力 +{n}", "生命值 {n}/{m}", "背包 {n}/{m}",
+    "<color=#{hex}>稀有</color>", "<color=#{hex}>传说装备</color>", "<size={n}>任务完成</size>",
+    "按 {{{n}}} 键打开背包", "击败 {n} 只妖兽", "还需要 {n} 个精铁矿石才能锻造", "连续登录 {n} 天奖励",
+]
+
+
+# Lines naming a character, which masking cannot tell apart
+NAME_TEMPLATES = ["{name}加入了队伍", "{name}：多谢相助！", "{name}离开了队伍", "与{name}的好感度提升了"]
+NAMES = ["李逍遥", "赵灵儿", "林月如", "张无忌", "令狐冲", "黄蓉", "阿奴", "酒剑仙"]
+
+# Characters random dialogue lines are drawn from
+DIALOGUE_CHARACTERS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏剑刀丹药龙凤虎山河城门客栈掌柜仙魔妖兽师父你我他的了是在有不"
+
+
+def generate_lines(count, seed):
+    """Returns game-like source lines.
+
+    Unique dialogue, fixed UI strings, templates filled with random values
+    and lines naming characters, in roughly the mix of a game dump.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            lines.append("".join(rng.choices(DIALOGUE_CHARACTERS, k=rng.randint(8, 30))) + "。")
+        elif kind < 0.55:
+            lines.append(rng.choice(GAME_STRINGS))
+        elif kind < 0.9:
+            lines.append(rng.choice(TEMPLATES).format(n=rng.randint(1, 9999), m=rng.randint(1, 99), hex=f"{rng.randrange(1 << 24):06x}"))
+        else:
+            lines.append(rng.choice(NAME_TEMPLATES).format(name=rng.choice(NAMES)))
+    return lines
+
+
+def load_dump(path):
+    """Returns the source lines of an XUnity translation file, or of a file of plain lines."""
+    lines = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("//"):
+                continue
+            # XUnity escapes "=" inside texts as "\="
+            index = line.find("=")
+            while index > 0 and line[index - 1] == "\\":
+                index = line.find("=", index + 1)
+            lines.append(line[:index] if index > 0 else line)
+    return lines
+
+
+def model(text):
+    """Stand-in for the model: keeps numbers and tags, converts the Han text."""
+    return "EN:" + convert_pinyin_to_english(text)
+
+
+def replay(lines, reuse_threshold):
+    """Returns ``(model_calls, template_hits, fuzzy_hits, mismatches)`` for the distinct ``lines``."""
+    memory = TranslationMemory(path=None, suggest_threshold=0, reuse_threshold=reuse_threshold)
+    calls = mismatches = 0
+    for line in dict.fromkeys(lines):
+        fuzzy_before = memory.fuzzy_hits
+        remembered = memory.lookup(line)
+        if remembered is None:
+            calls += 1
+            memory.add(line, model(line))
+        elif remembered != model(line):
+            mismatches += 1
+            if memory.fuzzy_hits == fuzzy_before:
+                raise AssertionError(f"Template answer differs for {line!r}: {remembered!r}")
+    return calls, memory.template_hits, memory.fuzzy_hits, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dump", help="XUnity translation file or file of source lines (default: generated lines)")
+    parser.add_argument("--lines", type=int, default=20000, help="generated lines")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reuse", type=float, default=0.8, help="similarity for fuzzy reuse")
+    args = parser.parse_args()
+
+    lines = load_dump(args.dump) if args.dump else generate_lines(args.lines, args.seed)
+    distinct = len(set(lines))
+    print(f"{len(lines)} lines, {distinct} distinct: {distinct} model calls with the exact cache alone")
+    for label, threshold in (("templates", 0), (f"templates + fuzzy reuse at {args.reuse}", args.reuse)):
+        calls, template_hits, fuzzy_hits, mismatches = replay(lines, threshold)
+        print(
+            f"{label}: {calls} model calls ({1 - calls / distinct:.1%} fewer), "
+            f"{template_hits} template hits, {fuzzy_hits} fuzzy hits, {mismatches} fuzzy answers differ from the model"
+        )
+
+
+if __name__ == "__main__":
+    main()
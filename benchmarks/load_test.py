@@ -0,0 +1,219 @@
+"""Load test comparing the gevent and ASGI translation servers.
+
+Starts the stub model server (or uses the in-process stub backend with
+``--stub in-process``), then runs each server mode in turn against it and
+drives ``/translate`` with many concurrent keep-alive connections:
+
+    python -m benchmarks.load_test --connections 500 --duration 10 --latency-ms 50
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+from urllib.parse import quote
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    """Returns a TCP port that is free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    """Waits until something accepts connections on ``port``."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start_stub_server(port, latency_ms, extra_args=()):
+    """Starts the stub model server in a subprocess."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_model_server", "--port", str(port), "--latency-ms", str(latency_ms), *extra_args],
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return process
+
+
+def stub_calls(port):
+    """Returns how many upstream calls the stub model server has answered."""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/calls") as response:
+        return json.loads(response.read())["calls"]
+
+
+def start_translator(server, port, stub_port=None, env=None, args=()):
+    """Starts the translation server in a subprocess, pointed at the stub.
+
+    Without ``stub_port`` the translator uses the in-process stub backend,
+    configured through the STUB_* settings in ``env``.
+    """
+    process_env = dict(os.environ)
+    process_env.update({"API_KEY": "stub", "TRANSLATION_CACHE_PATH": "", "TRANSLATION_TERMS_PATH": "", "TRANSLATION_MEMORY_PATH": ""})
+    if stub_port:
+        process_env["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{stub_port}"
+    else:
+        process_env["MODEL_BACKEND"] = "stub"
+    process_env.update(env or {})
+    process = subprocess.Popen(
+        [sys.executable, "auto_translator.py", "--server", server, "--port", str(port), *args],
+        cwd=REPO_ROOT,
+        env=process_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return process
+
+
+def stop_process(process):
+    """Stops a subprocess started by this module."""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response and returns ``(status, body)``."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                await reader.readline()
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, body
+
+
+async def request(reader, writer, path):
+    """Sends a GET over an open keep-alive connection and reads the reply."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode("ascii"))
+    await writer.drain()
+    return await read_response(reader)
+
+
+async def connection_worker(port, next_text, deadline, results):
+    """Keeps one connection busy until ``deadline``, recording every request."""
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        path = "/translate?text=" + quote(next_text())
+        started = time.perf_counter()
+        try:
+            status, _ = await request(reader, writer, path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            results.append((time.perf_counter() - started, None))
+            writer.close()
+            writer = None
+            continue
+        results.append((time.perf_counter() - started, status))
+    if writer is not None:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    """Returns the value at ``fraction`` of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(results, elapsed):
+    """Turns raw ``(latency, status)`` pairs into summary statistics."""
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        "requests": len(results),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(results) if results else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run_load(port, next_text, connections, duration):
+    """Runs ``connections`` concurrent keep-alive clients for ``duration`` seconds."""
+    results = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(connection_worker(port, next_text, deadline, results) for _ in range(connections)))
+    return summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["gevent", "asgi"])
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--unique-texts", type=int, default=5000)
+    parser.add_argument("--stub", choices=["server", "in-process"], default="server")
+    args = parser.parse_args()
+
+    texts = [f"测试文本 {i}" for i in range(args.unique_texts)]
+    env = {"TRANSLATION_MAX_CONCURRENCY": "64", "TRANSLATION_MAX_QUEUE": "100000", "STUB_LATENCY_MS": str(args.latency_ms)}
+    stub_port = stub = None
+    if args.stub == "server":
+        stub_port = free_port()
+        stub = start_stub_server(stub_port, args.latency_ms)
+    try:
+        for mode in args.modes:
+            port = free_port()
+            translator = start_translator(mode, port, stub_port, env=env)
+            calls_before = stub_calls(stub_port) if stub else 0
+            try:
+                stats = asyncio.run(run_load(port, lambda: random.choice(texts), args.connections, args.duration))
+            finally:
+                stop_process(translator)
+            stats["upstream_calls"] = stub_calls(stub_port) - calls_before if stub else None
+            print(
+                f"{mode:>7}: {stats['requests']} requests, {stats['throughput_rps']:.0f} req/s, "
+                f"p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, "
+                f"errors {stats['error_rate']:.1%}, {stats['upstream_calls'] if stub else 'n/a'} upstream calls"
+            )
+    finally:
+        if stub:
+            stop_process(stub)
+
+
+if __name__ == "__main__":
+    main()
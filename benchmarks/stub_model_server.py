@@ -0,0 +1,135 @@
+"""Local stand-in for the Gemini REST API, for load testing without the live API.
+
+Answers ``POST /v1beta/models/<model>:generateContent`` with a response of the
+same shape as Gemini, built by the same ``make_stub_reply`` as the in-process
+stub backend, and ``POST /v1beta/cachedContents`` for context caching. Latency,
+error rate and payload size are configurable. Point the
+generators at it with ``GEMINI_API_ENDPOINT=http://127.0.0.1:<port>``:
+
+    python -m benchmarks.stub_model_server --port 8765 --latency-ms 200 --error-rate 0.01
+"""
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_backend import make_stub_reply
+
+
+def instruction_text(body):
+    """Returns the text of a request's system instruction."""
+    return "".join(part.get("text", "") for part in body.get("systemInstruction", {}).get("parts", []))
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    latency = 0.0
+    error_rate = 0.0
+    payload_size = 0
+    random = random.Random(0)
+
+    calls = 0
+    calls_lock = threading.Lock()
+
+    # Context caches by name, holding their system instruction; smaller ones are refused like Gemini does
+    cached_contents = {}
+    cache_min_tokens = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.split("?")[0].endswith("/cachedContents"):
+            self.create_cached_content(body)
+            return
+        with self.calls_lock:
+            StubModelHandler.calls += 1
+            failed = self.random.random() < self.error_rate
+
+        prompt = "".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        # The system instruction is billed as input like the prompt, at a reduced rate when cached
+        cached = self.cached_contents.get(body.get("cachedContent"), "")
+        instruction = cached or instruction_text(body)
+        generation_config = body.get("generationConfig", {})
+        wants_json = generation_config.get("responseMimeType", generation_config.get("response_mime_type")) == "application/json"
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failed:
+            self.send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (stub)", "status": "RESOURCE_EXHAUSTED"}})
+            return
+
+        reply = make_stub_reply(prompt, wants_json, self.payload_size)
+        self.send_json(200, {
+            "candidates": [{
+                "content": {"parts": [{"text": reply}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": (len(prompt) + len(instruction)) // 4,
+                "candidatesTokenCount": len(reply) // 4,
+                "cachedContentTokenCount": len(cached) // 4,
+                "totalTokenCount": (len(prompt) + len(instruction) + len(reply)) // 4,
+            },
+        })
+
+    def create_cached_content(self, body):
+        instruction = instruction_text(body)
+        if len(instruction) // 4 < self.cache_min_tokens:
+            self.send_json(400, {"error": {
+                "code": 400, "status": "INVALID_ARGUMENT",
+                "message": f"Cached content is too small. total_token_count={len(instruction) // 4}, min_total_token_count={self.cache_min_tokens}",
+            }})
+            return
+        name = f"cachedContents/stub-{len(self.cached_contents)}"
+        StubModelHandler.cached_contents[name] = instruction
+        self.send_json(200, {"name": name, "model": body.get("model", ""), "usageMetadata": {"totalTokenCount": len(instruction) // 4}})
+
+    def do_GET(self):
+        # /calls lets load tests read how many upstream calls were made
+        self.send_json(200, {"calls": StubModelHandler.calls})
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, latency=0.0, error_rate=0.0, payload_size=0, seed=0, cache_min_tokens=0):
+    """Serves the stub model until interrupted."""
+    StubModelHandler.cache_min_tokens = cache_min_tokens
+    StubModelHandler.latency = latency
+    StubModelHandler.error_rate = error_rate
+    StubModelHandler.payload_size = payload_size
+    StubModelHandler.random = random.Random(seed)
+    server = ThreadingHTTPServer((host, port), StubModelHandler)
+    server.daemon_threads = True
+    print(f"Stub model server at http://{host}:{port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--payload-size", type=int, default=0, help="minimum length of each answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-min-tokens", type=int, default=0, help="smallest context cache accepted")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.latency_ms / 1000, args.error_rate, args.payload_size, args.seed, args.cache_min_tokens)
@@ -0,0 +1,294 @@
+import time
+import asyncio
+import gevent
+
+from collections import deque
+from gevent import GreenletExit
+from gevent.event import AsyncResult, Event
+from gevent.pool import Pool
+from gevent.threadpool import ThreadPool
+
+
+class Overloaded(Exception):
+    """Raised when the upstream queue is full and a call is rejected."""
+
+
+class UpstreamTimeout(Exception):
+    """Raised when an upstream call misses its deadline."""
+
+
+class _Abandoned(Exception):
+    """Handed to the followers of a call whose leader was killed or cancelled rather than failing."""
+
+
+def _capture(fn, args, kwargs):
+    # Hand exceptions back as values; gevent's thread pool prints a traceback
+    # for every task that raises, even though the caller handles the error
+    try:
+        return True, fn(*args, **kwargs)
+    except Exception as e:
+        return False, e
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait on the leader's result and receive
+    the same value or exception. If the leader is killed instead, one of the
+    followers runs the call again. Must be used from greenlets running in the
+    hub's thread, which is how gevent's WSGIServer handles requests.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Runs ``fn`` for ``key`` unless an identical call is already in flight."""
+        call = self._calls.get(key)
+        while call is not None:
+            self.followers += 1
+            try:
+                return call.get()
+            except _Abandoned:
+                # The leader was killed, e.g. with its client's bulk request; run the call again
+                call = self._calls.get(key)
+
+        call = AsyncResult()
+        self._calls[key] = call
+        self.leaders += 1
+        try:
+            result = fn(*args, **kwargs)
+        except GreenletExit:
+            call.set_exception(_Abandoned())
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def in_flight(self):
+        """Returns the number of keys currently being executed."""
+        return len(self._calls)
+
+
+class UpstreamPool:
+    """Long-lived, bounded execution layer for blocking upstream calls.
+
+    At most ``max_concurrency`` calls run at once and at most ``max_queue``
+    more wait for a slot; anything beyond that is rejected immediately with
+    ``Overloaded``. Each call must finish within ``timeout`` seconds, queueing
+    included, or ``UpstreamTimeout`` is raised.
+
+    ``mode="thread"`` runs calls on a gevent thread pool, which suits blocking
+    client libraries. ``mode="greenlet"`` runs them as greenlets, which is
+    cheaper but only useful when the client cooperates with gevent (e.g. after
+    monkey-patching).
+    """
+
+    def __init__(self, max_concurrency=8, max_queue=64, timeout=30, mode="thread"):
+        if mode not in ("thread", "greenlet"):
+            raise ValueError(f"Unknown upstream pool mode: {mode}")
+
+        self.mode = mode
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        # Created on first use so the pool belongs to the hub that serves requests
+        self._pool = None
+
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.mode == "thread":
+                self._pool = ThreadPool(self.max_concurrency)
+            else:
+                self._pool = Pool(self.max_concurrency)
+        return self._pool
+
+    def apply(self, fn, *args, timeout=None, **kwargs):
+        """Runs ``fn(*args, **kwargs)`` in the pool and waits for its result."""
+        if self.pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} upstream calls already pending")
+
+        deadline = self.timeout if timeout is None else timeout
+        timer = gevent.Timeout.start_new(deadline)
+        task = None
+        self.pending += 1
+        try:
+            # spawn() waits for a free slot, so the deadline covers queueing too
+            task = self._get_pool().spawn(_capture, fn, args, kwargs)
+            # Free the slot when the call really ends, not when the caller gives up
+            task.rawlink(self._release)
+            succeeded, value = task.get()
+            if not succeeded:
+                raise value
+            return value
+        except gevent.Timeout as e:
+            if e is not timer:
+                raise
+            self.timed_out += 1
+            if task is not None and self.mode == "greenlet":
+                task.kill(block=False)
+            raise UpstreamTimeout(f"Upstream call did not finish within {deadline}s")
+        finally:
+            timer.close()
+            if task is None:
+                self.pending -= 1
+
+    def iterate(self, make_iterator, timeout=None):
+        """Consumes ``make_iterator()`` in the pool, yielding its items as they arrive.
+
+        The iterator holds one pool slot until it is exhausted, and the whole
+        iteration must finish within the deadline.
+        """
+        if self.pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} upstream calls already pending")
+
+        deadline = self.timeout if timeout is None else timeout
+        items = deque()
+        finished = []
+        ready = Event()
+        # Async watchers are the thread-safe way to wake the hub from a worker thread
+        watcher = gevent.get_hub().loop.async_()
+        watcher.start(ready.set)
+
+        def produce():
+            try:
+                for item in make_iterator():
+                    items.append(item)
+                    watcher.send()
+            except BaseException as e:
+                finished.append(e)
+            else:
+                finished.append(None)
+            watcher.send()
+
+        def close_watcher(_task=None):
+            watcher.stop()
+            watcher.close()
+
+        # The consumer runs between our yields, so enforce the deadline with
+        # bounded waits rather than a gevent.Timeout that could fire in its code
+        expires = time.monotonic() + deadline
+        task = None
+        self.pending += 1
+        try:
+            with gevent.Timeout(deadline, UpstreamTimeout(f"Upstream stream did not start within {deadline}s")):
+                task = self._get_pool().spawn(produce)
+            task.rawlink(self._release)
+            while True:
+                while items:
+                    yield items.popleft()
+                if finished:
+                    # Drain items appended just before the producer finished
+                    while items:
+                        yield items.popleft()
+                    if finished[0] is not None:
+                        raise finished[0]
+                    return
+                if not ready.wait(max(0, expires - time.monotonic())):
+                    self.timed_out += 1
+                    if self.mode == "greenlet":
+                        task.kill(block=False)
+                    raise UpstreamTimeout(f"Upstream stream did not finish within {deadline}s")
+                ready.clear()
+        finally:
+            if task is None:
+                self.pending -= 1
+            if task is None or finished:
+                close_watcher()
+            else:
+                # The producer may still send after an abandoned iteration
+                task.rawlink(close_watcher)
+
+    def _release(self, _task):
+        self.pending -= 1
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of ``SingleFlight`` for the ASGI server."""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Awaits ``fn`` for ``key`` unless an identical call is already in flight."""
+        call = self._calls.get(key)
+        while call is not None:
+            self.followers += 1
+            try:
+                return await asyncio.shield(call)
+            except _Abandoned:
+                # The leader's request was cancelled; run the call again
+                call = self._calls.get(key)
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        self.leaders += 1
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            # A future can't carry CancelledError; followers get _Abandoned and retry
+            call.set_exception(_Abandoned() if isinstance(e, asyncio.CancelledError) else e)
+            # Mark the exception as retrieved when nobody was waiting for it
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def in_flight(self):
+        """Returns the number of keys currently being executed."""
+        return len(self._calls)
+
+
+class AsyncUpstreamPool:
+    """asyncio counterpart of ``UpstreamPool`` with the same limits."""
+
+    def __init__(self, max_concurrency=8, max_queue=64, timeout=30):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def apply(self, fn, *args, timeout=None, **kwargs):
+        """Awaits ``fn(*args, **kwargs)`` once a slot is free."""
+        if self.pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} upstream calls already pending")
+
+        deadline = self.timeout if timeout is None else timeout
+        self.pending += 1
+        try:
+            return await asyncio.wait_for(self._run(fn, *args, **kwargs), deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise UpstreamTimeout(f"Upstream call did not finish within {deadline}s")
+        finally:
+            self.pending -= 1
+
+    async def _run(self, fn, *args, **kwargs):
+        async with self._slots:
+            return await fn(*args, **kwargs)
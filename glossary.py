@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+
+from collections import deque
+
+from translation_cache import normalize_text
+
+# Source texts harvested as terms: nothing but Han characters, like names, items and menu labels
+HAN_TERM_PATTERN = re.compile('^[\u3400-\u9fff\uf900-\ufaff]+$')
+HAN_CHARACTER_PATTERN = re.compile('[\u3400-\u9fff\uf900-\ufaff]')
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton finding every occurrence of a set of words in one pass over a text."""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._output = [()]
+        for word in words:
+            node = 0
+            for character in word:
+                child = self._goto[node].get(character)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][character] = child
+                    self._goto.append({})
+                    self._output.append(())
+                node = child
+            self._output[node] = (word,)
+
+        # Breadth-first, so a node's failure link is final before its children need it
+        self._fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for character, child in self._goto[node].items():
+                pending.append(child)
+                fail = self._fail[node]
+                while fail and character not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(character, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """Yields ``(start, word)`` for every occurrence of a word in ``text``, overlapping ones included."""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, character in enumerate(text):
+            while node and character not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(character, 0)
+            for word in output[node]:
+                yield index - len(word) + 1, word
+
+    def find_longest(self, text):
+        """Returns the words found in ``text``, preferring the longest at each position and skipping overlaps."""
+        found = sorted(self.find(text), key=lambda match: (match[0], -len(match[1])))
+        words = []
+        end = 0
+        for start, word in found:
+            if start >= end:
+                words.append(word)
+                end = start + len(word)
+        return words
+
+
+def load_glossary_file(path):
+    """Reads a glossary file of ``source<TAB>translation`` lines; ``#`` starts a comment line."""
+    terms = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#") or "\t" not in line:
+                continue
+            source, target = line.split("\t", 1)
+            source, target = normalize_text(source), target.strip()
+            if source and target:
+                terms[source] = target
+    return terms
+
+
+class Glossary:
+    """Terminology memory: a user-edited glossary plus term pairs harvested from translations.
+
+    Every source term is indexed in an Aho-Corasick automaton, so the terms
+    occurring in a text are found in one pass whatever the glossary size and
+    only those are sent with the prompt. A text that is itself a term is
+    answered without calling the model. Short all-Han texts translated by
+    the model (names, items, menu labels) are harvested into a SQLite table
+    shared by every process. Texts shorter than ``min_term_chars``, such as
+    a lone 是, are too ambiguous to be harvested. User entries win over
+    harvested ones. The file and table are checked for changes every
+    ``reload_interval`` seconds. Only new rows of the table are read, and
+    harvested terms have their own automaton, rebuilt in a background thread
+    while the old one keeps serving.
+    """
+
+    def __init__(self, path=None, terms_path=None, max_hints=32, min_term_chars=2, max_term_chars=8, reload_interval=5):
+        self.path = path
+        self.terms_path = terms_path
+        self.max_hints = max_hints
+        self.min_term_chars = min_term_chars
+        self.max_term_chars = max_term_chars
+        self.reload_interval = reload_interval
+
+        self._user = {}
+        self._harvested = {}
+        # User and harvested terms are indexed apart, so harvested ones never shadow user ones
+        self._user_automaton = AhoCorasick(())
+        self._harvested_automaton = AhoCorasick(())
+        self._lock = threading.Lock()
+        self._checked = None
+        self._loaded = False
+        self._file_version = None
+        self._last_rowid = 0
+        self._dirty = False
+        self._builder = None
+        self.user_terms = 0
+        self.harvested_terms = 0
+
+        # Opened lazily and per process, like the translation cache
+        self._connection = None
+        self._connection_pid = None
+
+        self.exact_hits = 0
+        self.hinted = 0
+        self.harvested = 0
+
+    def _db(self):
+        if not self.terms_path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.terms_path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS terms ("
+                "source TEXT PRIMARY KEY, target TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+
+            file_version = None
+            if self.path and os.path.exists(self.path):
+                stat = os.stat(self.path)
+                file_version = (stat.st_mtime_ns, stat.st_size)
+            changed = False
+            if not self._loaded or file_version != self._file_version:
+                self._user = load_glossary_file(self.path) if file_version else {}
+                self._file_version = file_version
+                # Cache keys depend on the file entries, so an edit applies at once
+                self._user_automaton = AhoCorasick(self._user)
+                changed = True
+
+            # Only rows harvested since the last check are read
+            db = self._db()
+            if db is not None:
+                rows = db.execute(
+                    "SELECT rowid, source, target FROM terms WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+                ).fetchall()
+                for rowid, source, target in rows:
+                    # Rows harvested before the minimum length was raised are skipped
+                    if len(source) >= self.min_term_chars:
+                        self._harvested[source] = target
+                    self._last_rowid = rowid
+                self._dirty = self._dirty or bool(rows)
+
+            if not (changed or self._dirty):
+                return
+            self.user_terms = len(self._user)
+            self.harvested_terms = len(self._harvested)
+            if not self._loaded:
+                self._loaded = True
+                self._dirty = False
+                self._harvested_automaton = AhoCorasick(self._harvested)
+            elif self._dirty and self._builder is None:
+                # Rebuilding takes long for a large table; the current automaton serves meanwhile
+                self._builder = threading.Thread(target=self._rebuild, daemon=True)
+                self._builder.start()
+
+    def _rebuild(self):
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    self._builder = None
+                    return
+                self._dirty = False
+                harvested = dict(self._harvested)
+            self._harvested_automaton = AhoCorasick(harvested)
+
+    def _term(self, source):
+        # User entries win over harvested ones
+        translation = self._user.get(source)
+        return translation if translation is not None else self._harvested.get(source)
+
+    def lookup(self, text):
+        """Returns the glossary translation when ``text`` is a whole term, else ``None``."""
+        self._refresh()
+        translation = self._term(normalize_text(text))
+        if translation is not None:
+            self.exact_hits += 1
+        return translation
+
+    def matches(self, texts, harvested=True):
+        """Returns the ``(term, translation)`` pairs occurring in any of ``texts``, up to ``max_hints``.
+
+        With ``harvested=False`` only entries of the glossary file are returned.
+        """
+        self._refresh()
+        automata = [self._user_automaton] + ([self._harvested_automaton] if harvested else [])
+        found = {}
+        for text in texts:
+            for automaton in automata:
+                for word in automaton.find_longest(text):
+                    # Checked against the dicts, which are ahead of an automaton still being rebuilt
+                    translation = self._term(word)
+                    if translation is not None:
+                        found.setdefault(word, translation)
+                        if len(found) >= self.max_hints:
+                            return list(found.items())
+        return list(found.items())
+
+    def hints(self, texts):
+        """Formats the entries matching ``texts`` as the glossary block sent before them, or ``""``."""
+        entries = self.matches(texts)
+        if not entries:
+            return ""
+        self.hinted += 1
+        return "Glossary:\n" + "\n".join(f"{source} = {target}" for source, target in entries)
+
+    def harvest(self, text, translation):
+        """Stores a model translation as a term pair if the source looks like a term."""
+        db = self._db()
+        if db is None:
+            return
+        source, target = normalize_text(text), translation.strip()
+        if (
+            not self.min_term_chars <= len(source) <= self.max_term_chars
+            or not HAN_TERM_PATTERN.match(source)
+            or not target or "\n" in target or len(target) > 8 * self.max_term_chars
+            or HAN_CHARACTER_PATTERN.search(target)
+            or self._term(source) is not None
+        ):
+            return
+        with self._lock:
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO terms (source, target, created) VALUES (?, ?, ?)", (source, target, time.time())
+            ).rowcount
+        self.harvested += inserted
+
+    def stats(self):
+        """Returns the glossary counters as a dict."""
+        return {
+            "user_terms": self.user_terms,
+            "harvested_terms": self.harvested_terms,
+            "exact_hits": self.exact_hits,
+            "hinted": self.hinted,
+            "harvested": self.harvested,
+        }
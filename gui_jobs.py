@@ -0,0 +1,114 @@
+import itertools
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class JobSignals(QObject):
+    """Signals a job emits; they are delivered on the GUI thread."""
+
+    started = Signal(int)
+    progress = Signal(int, str)
+    finished = Signal(int, object)
+    error = Signal(int, str)
+    cancelled = Signal(int)
+
+
+class Job(QRunnable):
+    """Runs ``fn(*args, progress=..., **kwargs)`` on a QThreadPool worker.
+
+    ``fn`` reports progress by calling the ``progress`` callback with a
+    message; that callback also raises ``JobCancelled`` once the job has been
+    cancelled, so long jobs stop at their next progress step. A blocking call
+    that is already running cannot be interrupted, but its result is dropped.
+    """
+
+    def __init__(self, job_id, fn, *args, **kwargs):
+        super().__init__()
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def report(self, message):
+        if self.is_cancelled:
+            raise JobCancelled()
+        self.signals.progress.emit(self.job_id, message)
+
+    def run(self):
+        if self.is_cancelled:
+            self.signals.cancelled.emit(self.job_id)
+            return
+
+        self.signals.started.emit(self.job_id)
+        try:
+            result = self.fn(*self.args, progress=self.report, **self.kwargs)
+        except JobCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as e:
+            if self.is_cancelled:
+                self.signals.cancelled.emit(self.job_id)
+            else:
+                self.signals.error.emit(self.job_id, str(e))
+        else:
+            if self.is_cancelled:
+                self.signals.cancelled.emit(self.job_id)
+            else:
+                self.signals.finished.emit(self.job_id, result)
+
+
+class JobManager(QObject):
+    """Submits jobs to a thread pool and keeps track of the ones in flight."""
+
+    started = Signal(int)
+    progress = Signal(int, str)
+    finished = Signal(int, object)
+    error = Signal(int, str)
+    cancelled = Signal(int)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues ``fn`` as a new job and returns its id."""
+        job = Job(next(self._ids), fn, *args, **kwargs)
+        job.signals.started.connect(self.started)
+        job.signals.progress.connect(self.progress)
+        job.signals.finished.connect(self._forget)
+        job.signals.finished.connect(self.finished)
+        job.signals.error.connect(self._forget)
+        job.signals.error.connect(self.error)
+        job.signals.cancelled.connect(self._forget)
+        job.signals.cancelled.connect(self.cancelled)
+        self.jobs[job.job_id] = job
+        self.pool.start(job)
+        return job.job_id
+
+    def cancel(self, job_id):
+        """Cancels a job; queued jobs never start and running ones drop their result."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+
+    def in_flight(self):
+        return len(self.jobs)
+
+    def _forget(self, job_id, *_):
+        self.jobs.pop(job_id, None)
@@ -1,29 +1,30 @@
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
+from model_backend import lazy_image_model
 
 # Load environment variables from .env
 load_dotenv()
 
-# Configure the API key for Google Generative AI
-genai.configure(api_key=os.getenv("API_KEY"))
-
-# Define the image generation model
-imagen = genai.ImageGenerationModel("imagen-3.0-generate-001")
+# Define the image generation model; it is created on first use, on the
+# backend selected by MODEL_BACKEND
+imagen = lazy_image_model("imagen-3.0-generate-001")
 
 def generate_image_from_prompt(prompt):
     """Generates an image based on the provided prompt."""
+    return generate_images_from_prompt(prompt, number_of_images=1)[0]
+
+def generate_images_from_prompt(prompt, number_of_images=1):
+    """Generates ``number_of_images`` images based on the provided prompt."""
     try:
         result = imagen.generate_images(
             prompt=prompt,
-            number_of_images=1,
+            number_of_images=number_of_images,
             safety_filter_level="block_only_high",
             person_generation="allow_adult",
             aspect_ratio="3:4",
             negative_prompt="Outside",
         )
-        # Return the PIL image
-        return result.images[0]._pil_image
+        # Return the PIL images
+        return [image._pil_image for image in result.images]
 
     except Exception as e:
         raise Exception(f"Error generating image: {str(e)}")
@@ -1,19 +1,31 @@
+import html
 import json
 import sys
 import time
-import multiprocessing
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel,
     QTextEdit, QPushButton, QFileDialog, QGroupBox,
-    QHBoxLayout, QMessageBox
+    QHBoxLayout, QMessageBox, QSpinBox, QListWidget, QListWidgetItem
 )
-from PySide6.QtGui import QPixmap, QIcon
-from PySide6.QtCore import Qt
-from io import BytesIO
-from image_generator import generate_image_from_prompt
+from PySide6.QtGui import QPixmap, QIcon, QImageReader
+from PySide6.QtCore import Qt, QSize, QTimer
+from gui_jobs import JobManager
+from qt_images import THUMBNAIL_SIZE, make_thumbnail
+from image_generator import generate_images_from_prompt
 from recipe_generator import generate_recipe_from_prompt
-from auto_translator import run_translation, stop_translation
+from translator_supervisor import TranslatorSupervisor
+
+def render_images(prompt, number_of_images=1, progress=None):
+    """Generates images for ``prompt`` and returns them as QImage thumbnails.
+
+    Runs in a background job, so both the model call and the image conversion
+    stay off the GUI thread.
+    """
+    progress("Generating images...")
+    pil_images = generate_images_from_prompt(prompt, number_of_images)
+    progress("Converting images...")
+    return [make_thumbnail(pil_image) for pil_image in pil_images]
 
 class GeneratorApp(QWidget):
     def __init__(self):
@@ -69,11 +81,26 @@ class GeneratorApp(QWidget):
         self.upload_button.clicked.connect(self.upload_image)
         self.group_layout.addWidget(self.upload_button)
 
+        # Cancels the recipe generations still in flight
+        self.cancel_recipe_button = QPushButton("Cancel")
+        self.cancel_recipe_button.clicked.connect(self.cancel_recipe_jobs)
+        self.cancel_recipe_button.setEnabled(False)
+        self.group_layout.addWidget(self.cancel_recipe_button)
+
         # Generate Button
         self.generate_button = QPushButton("Generate")
         self.generate_button.setIcon(QIcon("icons/magic-wand.png"))
         self.generate_button.clicked.connect(self.generate_content)
         self.group_layout.addWidget(self.generate_button)
+
+        # Number of images generated per prompt
+        self.image_count_layout = QHBoxLayout()
+        self.image_count_label = QLabel("Images per prompt:")
+        self.image_count_layout.addWidget(self.image_count_label)
+        self.image_count_input = QSpinBox()
+        self.image_count_input.setRange(1, 4)
+        self.image_count_layout.addWidget(self.image_count_input)
+        self.group_layout.addLayout(self.image_count_layout)
         
         # Start Button (toggle button for start/stop)
         self.start_button = QPushButton("Start")
@@ -89,15 +116,29 @@ class GeneratorApp(QWidget):
         self.uploaded_image_label = QLabel()
         self.uploaded_image_label.setAlignment(Qt.AlignCenter)
         self.group_layout.addWidget(self.uploaded_image_label)
+
+        # Generated images fill in here as their jobs finish
+        self.image_results = QListWidget()
+        self.image_results.setViewMode(QListWidget.IconMode)
+        self.image_results.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.image_results.setResizeMode(QListWidget.Adjust)
+        self.image_results.setWordWrap(True)
+        self.group_layout.addWidget(self.image_results)
         
         # Result display
         self.result_label = QLabel("Output:")
         self.result_label.setWordWrap(True)
         self.group_layout.addWidget(self.result_label)
 
+        # Live throughput of the translator process
+        self.translator_stats_label = QLabel("Translator stopped.")
+        self.group_layout.addWidget(self.translator_stats_label)
+
         self.translator_output = QTextEdit()
         self.translator_output.setReadOnly(True)
         self.translator_output.setPlaceholderText("The results will be displayed here...")
+        # Keep only the latest requests so a long session does not grow the widget forever
+        self.translator_output.document().setMaximumBlockCount(1000)
         self.group_layout.addWidget(self.translator_output)
         
         # Result Output Box
@@ -117,8 +158,26 @@ class GeneratorApp(QWidget):
         # To store the uploaded image path
         self.image_path = None
 
-        # Track whether the process is running
-        self.autotranslator_process = None
+        # Background jobs keep model calls off the GUI thread; they wait on the network, so run several at once
+        self.recipe_jobs = JobManager(max_threads=4, parent=self)
+        self.recipe_jobs.started.connect(lambda job_id: self.log_message(f"Recipe job {job_id} started."))
+        self.recipe_jobs.progress.connect(lambda job_id, message: self.log_message(f"Recipe job {job_id}: {message}"))
+        self.recipe_jobs.finished.connect(self.on_recipe_finished)
+        self.recipe_jobs.error.connect(self.on_recipe_error)
+        self.recipe_jobs.cancelled.connect(self.on_recipe_cancelled)
+
+        # Image prompts queue up here; each job keeps a placeholder in the results list
+        self.image_jobs = JobManager(max_threads=2, parent=self)
+        self.image_jobs.progress.connect(lambda job_id, message: self.log_message(f"Image job {job_id}: {message}"))
+        self.image_jobs.finished.connect(self.on_images_finished)
+        self.image_jobs.error.connect(self.on_images_error)
+        self.image_placeholders = {}
+
+        # Runs the translator process; its events are picked up on every timer tick
+        self.translator = TranslatorSupervisor()
+        self.translator_timer = QTimer(self)
+        self.translator_timer.setInterval(250)
+        self.translator_timer.timeout.connect(self.poll_translator)
 
         # Initialize the UI based on the default selection
         self.current_generation_type = "Recipe Generation"
@@ -135,27 +194,42 @@ class GeneratorApp(QWidget):
             self.prompt_label.show()
             self.prompt_input.show()
             self.generate_button.show()
+            self.image_count_label.show()
+            self.image_count_input.show()
+            self.image_results.show()
             self.upload_button.hide()
+            self.cancel_recipe_button.hide()
             self.result_output.hide()
             self.image_display_label.hide()
             self.uploaded_image_label.hide()
             self.start_button.hide()
+            self.translator_stats_label.hide()
             self.translator_output.hide()
         elif generation_type == "Recipe Generation":
             self.prompt_label.hide()
             self.prompt_input.hide()
             self.generate_button.hide()
+            self.image_count_label.hide()
+            self.image_count_input.hide()
+            self.image_results.hide()
             self.start_button.hide()
+            self.translator_stats_label.hide()
             self.translator_output.hide()
             self.upload_button.show()
+            self.cancel_recipe_button.show()
             self.result_output.show()
             self.image_display_label.show()
             self.uploaded_image_label.show()
         elif generation_type == "Text Translation":
             self.start_button.show()
+            self.translator_stats_label.show()
             self.translator_output.show()
             self.generate_button.hide()
+            self.image_count_label.hide()
+            self.image_count_input.hide()
+            self.image_results.hide()
             self.upload_button.hide()
+            self.cancel_recipe_button.hide()
             self.result_output.hide()
             self.image_display_label.hide()
             self.uploaded_image_label.hide()
@@ -325,27 +399,55 @@ class GeneratorApp(QWidget):
             """)
 
     def upload_image(self):
-        """Open a file dialog to upload an image and store its path."""
-        self.upload_button.setText("Uploading...")
-        try:
-            options = QFileDialog.Options()
-            file_name, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.xpm *.jpg *.jpeg *.bmp)", options=options)
-            if file_name:
-                self.image_path = file_name
-                self.log_message("Recipe generation started...")
-                recipe_text = generate_recipe_from_prompt(self.image_path)
-        finally:
-            self.upload_button.setText("Upload Image")
-            self.display_uploaded_image(file_name)
-            self.log_message(recipe_text)
-            self.log_message("Recipe generation completed successfully.")
-            self.display_recipe(recipe_text)
+        """Open a file dialog to upload an image and start generating its recipe."""
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.xpm *.jpg *.jpeg *.bmp)", options=options)
+        if not file_name:
+            return
+
+        self.image_path = file_name
+        self.display_uploaded_image(file_name)
+        job_id = self.recipe_jobs.submit(generate_recipe_from_prompt, file_name)
+        self.log_message(f"Recipe job {job_id} queued for {file_name}")
+        self.update_recipe_job_status()
+
+    def cancel_recipe_jobs(self):
+        """Cancel every recipe generation still in flight."""
+        self.recipe_jobs.cancel_all()
+        self.log_message("Cancelling recipe generation...")
+
+    def on_recipe_finished(self, job_id, recipe_text):
+        self.log_message(recipe_text)
+        self.log_message(f"Recipe job {job_id} completed successfully.")
+        self.display_recipe(recipe_text)
+        self.update_recipe_job_status()
+
+    def on_recipe_error(self, job_id, message):
+        self.log_message(f'<font color="red">Recipe job {job_id} failed: {message}</font>')
+        self.show_error_message(message)
+        self.update_recipe_job_status()
+
+    def on_recipe_cancelled(self, job_id):
+        self.log_message(f"Recipe job {job_id} cancelled.")
+        self.update_recipe_job_status()
+
+    def update_recipe_job_status(self):
+        """Reflect the number of recipe jobs in flight on the buttons."""
+        in_flight = self.recipe_jobs.in_flight()
+        self.upload_button.setText(f"Upload Image ({in_flight} generating)" if in_flight else "Upload Image")
+        self.cancel_recipe_button.setEnabled(in_flight > 0)
 
     def display_uploaded_image(self, file_path):
         """Display the uploaded image in the QLabel."""
         try:
-            pixmap = QPixmap(file_path)
-            self.uploaded_image_label.setPixmap(pixmap.scaled(100, 100, Qt.KeepAspectRatio))
+            # Decode straight at thumbnail size instead of the full photo
+            reader = QImageReader(file_path)
+            reader.setAutoTransform(True)
+            size = reader.size()
+            if size.isValid():
+                reader.setScaledSize(size.scaled(100, 100, Qt.KeepAspectRatio))
+            pixmap = QPixmap.fromImage(reader.read())
+            self.uploaded_image_label.setPixmap(pixmap)
             self.uploaded_image_label.setScaledContents(False)
         except Exception as e:
             self.show_error_message(f"Failed to display uploaded image: {str(e)}")
@@ -354,18 +456,17 @@ class GeneratorApp(QWidget):
         prompt = self.prompt_input.toPlainText()
         generation_type = self.current_generation_type
 
-        # Disable the generate button and change its text
-        self.generate_button.setEnabled(False)
-        self.generate_button.setText("Generating...")
-        
         self.log_message(f"Generating {generation_type} content...")
 
-        QApplication.processEvents()
-
         try:
             if generation_type == "Image Generation":
-                pil_image = generate_image_from_prompt(prompt)
-                self.display_image(pil_image)
+                # Queue the prompt; the button stays enabled so more prompts can follow
+                number_of_images = self.image_count_input.value()
+                job_id = self.image_jobs.submit(render_images, prompt, number_of_images)
+                label = prompt[:40].replace("\n", " ")
+                placeholder = QListWidgetItem(f"{label}\n(generating...)")
+                self.image_results.addItem(placeholder)
+                self.image_placeholders[job_id] = (placeholder, label)
 
             elif generation_type == "Xunity Autotranslator":
                 translated_text = self.translate_text(prompt)
@@ -375,23 +476,28 @@ class GeneratorApp(QWidget):
             self.show_error_message(f'Error: {str(e)}')
             self.log_message(f'<font color="red">Error occurred: {str(e)}</font>')
 
-        finally:
-            self.generate_button.setEnabled(True)
-            self.generate_button.setText("Generate")
-
-    def display_image(self, pil_image):
-        """Display the generated image in the QLabel."""
+    def on_images_finished(self, job_id, thumbnails):
+        """Replace the job's placeholder with its generated images."""
+        placeholder, label = self.image_placeholders.pop(job_id)
+        row = self.image_results.row(placeholder)
+        self.image_results.takeItem(row)
+        for offset, thumbnail in enumerate(thumbnails):
+            self.display_image(thumbnail, label, row + offset)
+        self.log_message(f"Image job {job_id} completed with {len(thumbnails)} image(s).")
+
+    def on_images_error(self, job_id, message):
+        placeholder, label = self.image_placeholders.pop(job_id)
+        placeholder.setText(f"{label}\n(failed)")
+        self.log_message(f'<font color="red">Image job {job_id} failed: {message}</font>')
+
+    def display_image(self, thumbnail, label, row):
+        """Display a generated image thumbnail in the results list."""
         try:
-            bytes_io = BytesIO()
-            pil_image.save(bytes_io, format='PNG')
-            bytes_io.seek(0)
-            pixmap = QPixmap()
-            pixmap.loadFromData(bytes_io.getvalue())
-            self.uploaded_image_label.setPixmap(pixmap.scaled(100, 100, Qt.KeepAspectRatio))
-            self.uploaded_image_label.setScaledContents(False)
+            item = QListWidgetItem(QIcon(QPixmap.fromImage(thumbnail)), label)
+            self.image_results.insertItem(row, item)
         except Exception as e:
             self.show_error_message(f"Failed to display generated image: {str(e)}")
-            
+
     def display_recipe(self, recipe_response):
         """Display the generated recipe text as a formatted recipe."""
         try:
@@ -428,32 +534,83 @@ class GeneratorApp(QWidget):
         except Exception as e:
             raise Exception(f"Error formatting recipe: {str(e)}")
         
-    def update_translator_output(self, output):
-        self.translator_output.append(f"Output received: {output}")
+    def update_translator_output(self, messages):
+        """Show a batch of translator messages with a single append."""
+        lines = []
+        for kind, payload in messages:
+            if kind == "batch":
+                for event in payload["events"]:
+                    line = f"{event['status']} {event['seconds'] * 1000:.0f} ms {event['endpoint']}"
+                    if event["text"] is not None:
+                        line += f" {event['text']!r}"
+                    if event["translation"] is not None:
+                        line += f" -> {event['translation']!r}"
+                    lines.append(html.escape(line))
+                if payload["stats"]:
+                    self.update_translator_stats(payload["stats"])
+            elif kind == "started":
+                lines.append(f"Translation process {payload['pid']} started ({payload['server']}).")
+            elif kind == "stopped":
+                lines.append(f"Translation process {payload['pid']} stopped.")
+            elif kind == "terminated":
+                lines.append(f'<font color="red">Translation process {payload["pid"]} did not stop in time and was terminated.</font>')
+            elif kind == "crashed":
+                lines.append(
+                    f'<font color="red">Translation process exited with code {payload["exitcode"]}, '
+                    f'restarting in {payload["restart_in"]}s.</font>'
+                )
+            elif kind == "restarted":
+                lines.append(f"Translation process restarted (restart {payload['restarts']}).")
+            elif kind == "gave_up":
+                lines.append(
+                    f'<font color="red">Translation process crashed {payload["crashes"]} times in a row, '
+                    f'giving up.</font>'
+                )
+                self.set_translator_stopped()
+        if lines:
+            self.translator_output.append("<br>".join(lines))
+
+    def update_translator_stats(self, stats):
+        self.translator_stats_label.setText(
+            f"{stats['requests_per_second']:.1f} req/s, {stats['requests']} requests, {stats['errors']} errors, "
+            f"cache hit ratio {stats['cache_hit_ratio']:.0%}, {stats['upstream_pending']} upstream pending"
+        )
+
+    def poll_translator(self):
+        """Pick up the translator's batched events; restarts it if it crashed."""
+        self.update_translator_output(self.translator.poll())
+
+    def set_translator_stopped(self):
+        self.translator_timer.stop()
+        self.start_button.setText("Start")
+        self.start_button.setIcon(QIcon("icons/play.png"))
+        self.translator_stats_label.setText("Translator stopped.")
 
     def toggle_process(self):
-        """Start or stop the translator process using multiprocessing."""
+        """Start or stop the supervised translator process."""
         try:
-            if self.start_button.text() == "Start":
+            if not self.translator.is_running():
                 self.translator_output.append("Starting translation process...")
-                self.autotranslator_process = multiprocessing.Process(target=run_translation)
-                self.autotranslator_process.start()
+                self.translator.start()
+                self.translator_timer.start()
                 self.start_button.setText("Stop")
                 self.start_button.setIcon(QIcon("icons/stop.png"))
-                self.translator_output.append("Translation process started.")
             else:
                 self.translator_output.append("Stopping translation process...")
-                if self.autotranslator_process and self.autotranslator_process.is_alive():
-                    stop_translation()
-                    self.autotranslator_process.terminate()
-                    self.autotranslator_process.join()
-                self.start_button.setText("Start")
-                self.start_button.setIcon(QIcon("icons/play.png"))
-                self.translator_output.append("Translation process stopped.")
+                # Waits for the requests in flight, up to the supervisor's stop timeout
+                self.update_translator_output(self.translator.stop())
+                self.set_translator_stopped()
         except Exception as e:
             self.show_error_message(f'Failed to manage translation process: {str(e)}')
             self.translator_output.append(f'<font color="red">Failed to manage translation process: {str(e)}</font>')
-        
+
+    def closeEvent(self, event):
+        """Drop pending jobs and stop the translator when the window closes."""
+        self.recipe_jobs.cancel_all()
+        self.image_jobs.cancel_all()
+        self.translator.stop()
+        super().closeEvent(event)
+
     def show_error_message(self, message):
         """Show an error message dialog."""
         QMessageBox.critical(self, "Error", message)
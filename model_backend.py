@@ -0,0 +1,509 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from upstream_guard import UpstreamGuard, estimate_tokens
+
+# Load environment variables from .env
+load_dotenv()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Models shared by every generator module, created on first use
+_models = {}
+_models_lock = threading.Lock()
+
+_guard = None
+
+# Seconds a renewed context cache is kept for calls that already picked it up
+CONTEXT_CACHE_GRACE = 60
+
+
+class GeminiBackend:
+    """Model backend that talks to the Gemini API through google-generativeai."""
+
+    name = "gemini"
+
+    def __init__(self, api_key=None, api_endpoint=None):
+        import google.generativeai as genai
+
+        self.genai = genai
+        self.api_endpoint = api_endpoint
+
+        # GEMINI_API_ENDPOINT points the client at another server speaking the Gemini REST API,
+        # such as the stub model server used for load testing
+        if api_endpoint:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": api_endpoint})
+        else:
+            genai.configure(api_key=api_key)
+
+    @property
+    def has_async_client(self):
+        """Whether ``generate_content_async`` really runs without blocking."""
+        # The REST transport has no async client
+        return not self.api_endpoint
+
+    def text_model(self, model_name, system_instruction=None):
+        """Returns a model exposing ``generate_content`` and ``generate_content_async``."""
+        return self.genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+    def cached_text_model(self, model_name, system_instruction, ttl):
+        """Returns a text model whose system instruction is kept in a context cache for ``ttl`` seconds.
+
+        Cached tokens are billed at a reduced rate, but the API only caches
+        prompts above a minimum size and needs a versioned model name, e.g.
+        ``gemini-1.5-flash-002``.
+        """
+        cached = self.genai.caching.CachedContent.create(
+            model=model_name, system_instruction=system_instruction, ttl=timedelta(seconds=ttl)
+        )
+        return self.genai.GenerativeModel.from_cached_content(cached)
+
+    def delete_cached_context(self, model):
+        """Deletes the context cache behind a model from ``cached_text_model``, which is billed until it expires."""
+        self.genai.caching.CachedContent.get(model.cached_content).delete()
+
+    def image_model(self, model_name):
+        """Returns a model exposing ``generate_images``."""
+        return self.genai.ImageGenerationModel(model_name)
+
+    def upload_file(self, path, mime_type=None, display_name=None):
+        """Uploads a file (a path or a file-like object) for use in a multimodal prompt."""
+        return self.genai.upload_file(path, mime_type=mime_type, display_name=display_name)
+
+
+class StubError(Exception):
+    """Raised by the stub backend to simulate an upstream failure."""
+
+    def __init__(self, message, code=429):
+        super().__init__(message)
+        self.code = code
+
+
+class StubResponse:
+    """Mimics the parts of a Gemini response the generators read."""
+
+    def __init__(self, text, prompt_token_count, cached_content_token_count=0):
+        self.text = text
+        self.usage_metadata = StubUsage(prompt_token_count, len(text) // 4, cached_content_token_count)
+
+
+class StubUsage:
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class StubFile:
+    """Mimics an uploaded file handle, which expires 48 hours after upload like Gemini's."""
+
+    def __init__(self, path, mime_type=None, display_name=None):
+        if hasattr(path, "read"):
+            data = path.read()
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+            display_name = display_name or os.path.basename(path)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        self.name = f"files/stub-{digest}"
+        self.uri = f"stub://{self.name}"
+        self.display_name = display_name
+        self.mime_type = mime_type
+        self.size_bytes = len(data)
+        self.expiration_time = datetime.now(timezone.utc) + timedelta(hours=48)
+
+
+class StubImage:
+    def __init__(self, pil_image):
+        self._pil_image = pil_image
+
+
+class StubImageResult:
+    def __init__(self, images):
+        self.images = images
+
+
+def prompt_text(contents):
+    """Flattens ``generate_content`` contents into the text parts of the prompt."""
+    if isinstance(contents, str):
+        return contents
+    return "".join(part for part in contents if isinstance(part, str))
+
+
+def make_stub_reply(prompt, wants_json, payload_size=0):
+    """Builds the deterministic answer the stub gives to ``prompt``.
+
+    Translation prompts get the source text back prefixed by ``EN:``; JSON
+    prompts that are or end in a JSON array (batched translations) get one
+    entry per element, and any other JSON prompt gets a list with one recipe.
+    ``payload_size`` pads the answer to at least that many characters.
+    """
+    if wants_json:
+        try:
+            texts = json.loads(prompt[prompt.rfind("\n\n") + 1:])
+        except ValueError:
+            texts = None
+        if isinstance(texts, list):
+            return json.dumps([f"EN:{text}" for text in texts], ensure_ascii=False)
+
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        recipe = {
+            "recipe_name": f"Stub dish {seed}",
+            "ingredients": ["1 cup rice", "2 eggs", "1 tbsp soy sauce"],
+            "instructions": ["Cook the rice.", "Scramble the eggs.", "Mix everything with the soy sauce."],
+        }
+        if payload_size:
+            recipe["instructions"].append("x" * payload_size)
+        return json.dumps([recipe])
+
+    reply = "EN:" + prompt
+    if len(reply) < payload_size:
+        reply += " " + "x" * (payload_size - len(reply) - 1)
+    return reply
+
+
+class StubTextModel:
+    def __init__(self, backend, model_name, system_instruction=None, cached=False):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached = cached
+
+    def _reply(self, contents, generation_config):
+        prompt = prompt_text(contents)
+        if isinstance(generation_config, dict):
+            mime_type = generation_config.get("response_mime_type")
+        else:
+            mime_type = getattr(generation_config, "response_mime_type", None)
+        wants_json = mime_type == "application/json"
+        # The system instruction is billed as input, and reported as cached when it comes from a context cache
+        instruction_tokens = len(self.system_instruction or "") // 4
+        return StubResponse(
+            make_stub_reply(prompt, wants_json, payload_size=self.backend.payload_size),
+            len(prompt) // 4 + instruction_tokens,
+            instruction_tokens if self.cached else 0,
+        )
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        if stream:
+            return self._stream(self._reply(contents, generation_config))
+        self.backend.simulate_call()
+        return self._reply(contents, generation_config)
+
+    def _stream(self, response, chunks=4):
+        # The latency is spread over the chunks, so the first one arrives early
+        self.backend._count_call()
+        text = response.text
+        size = max(1, -(-len(text) // chunks))
+        for start in range(0, len(text), size):
+            if self.backend.latency:
+                time.sleep(self.backend.latency / chunks)
+            chunk = StubResponse(text[start:start + size], 0)
+            # Like Gemini, the last chunk carries the usage of the whole call
+            if start + size >= len(text):
+                chunk.usage_metadata = response.usage_metadata
+            yield chunk
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        await self.backend.simulate_call_async()
+        return self._reply(contents, generation_config)
+
+
+class StubImageModel:
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_images(self, prompt, number_of_images=1, aspect_ratio="1:1", **kwargs):
+        from PIL import Image
+
+        self.backend.simulate_call()
+        ratio_width, ratio_height = (int(side) for side in aspect_ratio.split(":"))
+        # The short side is 1024 pixels, e.g. 1024x1365 for 3:4
+        short_side = min(ratio_width, ratio_height)
+        width = round(1024 * ratio_width / short_side)
+        height = round(1024 * ratio_height / short_side)
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:6], 16)
+        images = []
+        for index in range(number_of_images):
+            color = ((seed >> 16) & 0xFF, (seed >> 8) & 0xFF, (seed + index * 40) & 0xFF)
+            images.append(StubImage(Image.new("RGB", (width, height), color)))
+        return StubImageResult(images)
+
+
+class StubBackend:
+    """Deterministic local stand-in for the Gemini API.
+
+    Every call sleeps for ``latency`` seconds and fails with ``StubError`` at
+    ``error_rate`` (drawn from a seeded generator, so runs are reproducible).
+    ``payload_size`` pads text answers to at least that many characters.
+    """
+
+    name = "stub"
+    has_async_client = True
+
+    def __init__(self, latency=0.0, error_rate=0.0, payload_size=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.uploads = 0
+        self.deleted_caches = 0
+
+    def _count_call(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise StubError("429 Resource has been exhausted (stub)")
+
+    def simulate_call(self):
+        """Accounts for a blocking upstream call."""
+        if self.latency:
+            time.sleep(self.latency)
+        self._count_call()
+
+    async def simulate_call_async(self):
+        """Accounts for a non-blocking upstream call."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._count_call()
+
+    def text_model(self, model_name, system_instruction=None):
+        return StubTextModel(self, model_name, system_instruction)
+
+    def cached_text_model(self, model_name, system_instruction, ttl):
+        self.simulate_call()
+        return StubTextModel(self, model_name, system_instruction, cached=True)
+
+    def delete_cached_context(self, model):
+        self.simulate_call()
+        with self._lock:
+            self.deleted_caches += 1
+
+    def image_model(self, model_name):
+        return StubImageModel(self, model_name)
+
+    def upload_file(self, path, mime_type=None, display_name=None):
+        self.simulate_call()
+        with self._lock:
+            self.uploads += 1
+        return StubFile(path, mime_type, display_name)
+
+
+def create_backend(name=None):
+    """Creates the backend selected by ``name`` or the MODEL_BACKEND setting."""
+    name = name or os.getenv("MODEL_BACKEND", "gemini")
+    if name == "gemini":
+        return GeminiBackend(api_key=os.getenv("API_KEY"), api_endpoint=os.getenv("GEMINI_API_ENDPOINT"))
+    if name == "stub":
+        return StubBackend(
+            latency=float(os.getenv("STUB_LATENCY_MS", "0")) / 1000,
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+            payload_size=int(os.getenv("STUB_PAYLOAD_SIZE", "0")),
+            seed=int(os.getenv("STUB_SEED", "0")),
+        )
+    raise ValueError(f"Unknown model backend: {name}")
+
+
+def get_backend():
+    """Returns the process-wide model backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def create_guard():
+    """Creates the upstream guard from the UPSTREAM_* settings.
+
+    The per-minute budgets are split evenly between the ``UPSTREAM_PROCESSES``
+    processes calling Gemini, e.g. the workers of the translator.
+    """
+    processes = max(1, int(os.getenv("UPSTREAM_PROCESSES", "1")))
+    return UpstreamGuard(
+        requests_per_minute=float(os.getenv("UPSTREAM_REQUESTS_PER_MINUTE", "0")) / processes,
+        tokens_per_minute=float(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", "0")) / processes,
+        max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", "3")),
+        base_delay=float(os.getenv("UPSTREAM_BACKOFF_BASE_MS", "500")) / 1000,
+        max_delay=float(os.getenv("UPSTREAM_BACKOFF_MAX_MS", "20000")) / 1000,
+        breaker_threshold=int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5")),
+        breaker_reset=float(os.getenv("UPSTREAM_BREAKER_RESET", "30")),
+    )
+
+
+def get_guard():
+    """Returns the process-wide upstream guard shared by every generator."""
+    global _guard
+    if _guard is None:
+        with _backend_lock:
+            if _guard is None:
+                _guard = create_guard()
+    return _guard
+
+
+def upstream_stats():
+    """Returns the rate limiter, retry and circuit breaker counters."""
+    return get_guard().stats()
+
+
+def upload_file(path, mime_type=None, display_name=None):
+    """Uploads a file through the shared backend, under the upstream guard."""
+    return get_guard().call(get_backend().upload_file, path, mime_type=mime_type, display_name=display_name)
+
+
+def set_backend(backend):
+    """Replaces the process-wide model backend, e.g. with a ``StubBackend``.
+
+    Models already created are dropped, so lazy models switch to the new
+    backend on their next call.
+    """
+    global _backend
+    with _models_lock:
+        _backend = backend
+        _models.clear()
+
+
+def create_model(kind, model_name, system_instruction=None, cache_ttl=None):
+    """Creates a guarded model on the current backend; returns it with the time it expires (or ``None``)."""
+    backend = get_backend()
+    if kind == "image":
+        return GuardedModel(backend.image_model(model_name)), None
+
+    if system_instruction and cache_ttl:
+        try:
+            model = get_guard().call(backend.cached_text_model, model_name, system_instruction, cache_ttl)
+        except Exception as e:
+            # Prompts below the API's minimum cache size can't be cached; they still work uncached
+            logging.warning(f"Context cache unavailable for {model_name}, sending the instruction with each call: {e}")
+        else:
+            # Recreated a minute early so calls never reach an expired cache
+            return GuardedModel(model), time.monotonic() + max(cache_ttl - 60, cache_ttl / 2)
+    return GuardedModel(backend.text_model(model_name, system_instruction), estimate_tokens(system_instruction or "")), None
+
+
+def get_model(kind, model_name, system_instruction=None, cache_ttl=None):
+    """Returns the shared ``"text"`` or ``"image"`` model, creating it on first use.
+
+    Text models are shared per model name and system instruction, so the
+    instruction is set once per model rather than sent in every prompt. With
+    ``cache_ttl`` the instruction is kept in a context cache, renewed before
+    it expires.
+    """
+    key = (kind, model_name, system_instruction, cache_ttl)
+    entry = _models.get(key)
+    if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+        with _models_lock:
+            entry = _models.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                superseded = entry
+                entry = _models[key] = create_model(kind, model_name, system_instruction, cache_ttl)
+                if superseded is not None and superseded[1] is not None:
+                    retire_cached_model(superseded[0])
+    return entry[0]
+
+
+def retire_cached_model(model):
+    """Deletes the context cache of a renewed model once the calls still using it are done."""
+    backend = get_backend()
+
+    def delete():
+        try:
+            get_guard().call(backend.delete_cached_context, model.model)
+        except Exception as e:
+            logging.warning(f"Could not delete a superseded context cache: {e}")
+
+    timer = threading.Timer(CONTEXT_CACHE_GRACE, delete)
+    timer.daemon = True
+    timer.start()
+
+
+class GuardedModel:
+    """Sends a model's calls through the upstream guard.
+
+    ``instruction_tokens`` is added to the token estimate of every call, for
+    a system instruction billed with each prompt. Streamed calls are guarded
+    until the stream starts; a stream that fails halfway is not retried.
+    """
+
+    def __init__(self, model, instruction_tokens=0):
+        self.model = model
+        self.instruction_tokens = instruction_tokens
+
+    def generate_content(self, contents, *args, **kwargs):
+        tokens = estimate_tokens(contents) + self.instruction_tokens
+        return get_guard().call(self.model.generate_content, contents, *args, tokens=tokens, **kwargs)
+
+    async def generate_content_async(self, contents, *args, **kwargs):
+        tokens = estimate_tokens(contents) + self.instruction_tokens
+        return await get_guard().call_async(self.model.generate_content_async, contents, *args, tokens=tokens, **kwargs)
+
+    def generate_images(self, *args, **kwargs):
+        return get_guard().call(self.model.generate_images, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class LazyModel:
+    """Stands in for a model and forwards to the shared instance from ``get_model``.
+
+    Generator modules define their models with this at import time; the SDK
+    is imported and the model created only when one of its methods is used.
+    """
+
+    def __init__(self, kind, model_name, system_instruction=None, cache_ttl=None):
+        self.kind = kind
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cache_ttl = cache_ttl
+
+    def resolve(self):
+        """Returns the shared model, creating or renewing it; may call the API for a context cache."""
+        return get_model(self.kind, self.model_name, self.system_instruction, self.cache_ttl)
+
+    # The model is resolved when a call runs rather than when the method is looked up,
+    # so a context cache is created on the thread making the call, e.g. an upstream pool thread
+    def generate_content(self, *args, **kwargs):
+        return self.resolve().generate_content(*args, **kwargs)
+
+    async def generate_content_async(self, *args, **kwargs):
+        # Keeps the blocking context cache API call off the event loop
+        model = await asyncio.to_thread(self.resolve) if self.cache_ttl else self.resolve()
+        return await model.generate_content_async(*args, **kwargs)
+
+    def generate_images(self, *args, **kwargs):
+        return self.resolve().generate_images(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+def lazy_text_model(model_name, system_instruction=None, cache_ttl=None):
+    """Returns a text model that is created on first use.
+
+    ``system_instruction`` goes in the model's system-instruction slot; with
+    ``cache_ttl`` (seconds) it is kept in a context cache.
+    """
+    return LazyModel("text", model_name, system_instruction, cache_ttl)
+
+
+def lazy_image_model(model_name):
+    """Returns an image model that is created on first use."""
+    return LazyModel("image", model_name)
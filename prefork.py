@@ -0,0 +1,81 @@
+import time
+import signal
+import socket
+import multiprocessing
+
+from multiprocessing.connection import wait
+
+# Pending connections the kernel queues per listening socket
+LISTEN_BACKLOG = 1024
+# A worker that dies sooner than this after starting is restarted only after the same delay
+RESTART_DELAY = 1.0
+
+
+def listen(host, port, reuse_port=False):
+    """Returns a TCP socket listening on ``host:port``.
+
+    With ``reuse_port`` several processes can each bind their own socket to
+    the same port, and the kernel spreads incoming connections across them.
+    """
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    # gevent accepts only once the socket is readable, and workers sharing it race for each connection
+    sock.setblocking(False)
+    return sock
+
+
+def run_prefork(serve, host, port, workers, stop_timeout=10):
+    """Runs ``workers`` processes of ``serve(listener, host, port)`` on one port until interrupted.
+
+    Where the platform has SO_REUSEPORT, ``listener`` is ``None`` and each
+    worker binds its own socket, so the kernel balances connections between
+    them. Elsewhere the master binds one socket and the workers share its
+    accept queue. Workers that die are restarted. SIGTERM or SIGINT send
+    SIGTERM to every worker, which lets them finish the requests in flight,
+    and workers still alive after ``stop_timeout`` seconds are killed.
+    """
+    reuse_port = hasattr(socket, "SO_REUSEPORT")
+    listener = None if reuse_port else listen(host, port)
+    processes = {}
+    stopping = False
+
+    def start_worker(index):
+        process = multiprocessing.Process(target=serve, args=(listener, host, port), name=f"translator-worker-{index}")
+        process.start()
+        processes[index] = (process, time.monotonic())
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous_handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        for index in range(workers):
+            start_worker(index)
+        while not stopping:
+            wait([process.sentinel for process, _ in processes.values()], timeout=1)
+            for index, (process, started) in list(processes.items()):
+                if process.is_alive() or stopping:
+                    continue
+                print(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                if time.monotonic() - started < RESTART_DELAY:
+                    time.sleep(RESTART_DELAY)
+                start_worker(index)
+    finally:
+        for process, _ in processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + stop_timeout
+        for process, _ in processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if listener is not None:
+            listener.close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
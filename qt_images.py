@@ -0,0 +1,97 @@
+import threading
+import weakref
+
+from PIL import Image
+from PySide6.QtGui import QImage
+
+# Size of the thumbnails shown in the window
+THUMBNAIL_SIZE = 100
+
+# PIL modes that map directly onto a QImage format, with their bytes per pixel
+QIMAGE_FORMATS = {
+    "RGB": (QImage.Format_RGB888, 3),
+    "RGBA": (QImage.Format_RGBA8888, 4),
+    "RGBX": (QImage.Format_RGBX8888, 4),
+    "L": (QImage.Format_Grayscale8, 1),
+}
+
+
+def wrap_pil_image(pil_image):
+    """Wraps a PIL image's pixel bytes in a QImage without re-encoding them.
+
+    Returns ``(qimage, buffer)``. The QImage reads straight from ``buffer``,
+    so the caller must keep ``buffer`` alive for as long as it uses the image
+    (or take a ``copy()``). Modes Qt can't read directly are converted first.
+    """
+    if pil_image.mode not in QIMAGE_FORMATS:
+        pil_image = pil_image.convert("RGBA" if "A" in pil_image.getbands() else "RGB")
+    image_format, bytes_per_pixel = QIMAGE_FORMATS[pil_image.mode]
+    buffer = pil_image.tobytes()
+    # PIL packs rows tightly, so the stride is width * bytes per pixel with no padding
+    qimage = QImage(buffer, pil_image.width, pil_image.height, pil_image.width * bytes_per_pixel, image_format)
+    return qimage, buffer
+
+
+def pil_to_qimage(pil_image):
+    """Converts a PIL image to a QImage that owns its pixels.
+
+    QImage, unlike QPixmap, may be created off the GUI thread, so this can run
+    in a background job.
+    """
+    qimage, _buffer = wrap_pil_image(pil_image)
+    return qimage.copy()
+
+
+class ThumbnailCache:
+    """Caches thumbnails per PIL image object for as long as that image is alive."""
+
+    def __init__(self):
+        self._thumbnails = {}
+        self._tracked = set()
+        # Re-entrant: a finalizer can run during garbage collection while the lock is held
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pil_image, size=THUMBNAIL_SIZE):
+        """Returns the thumbnail of ``pil_image``, making it on first request."""
+        key = (id(pil_image), size)
+        with self._lock:
+            thumbnail = self._thumbnails.get(key)
+            if thumbnail is not None:
+                self.hits += 1
+                return thumbnail
+            self.misses += 1
+
+        thumbnail = render_thumbnail(pil_image, size)
+        with self._lock:
+            if id(pil_image) not in self._tracked:
+                # ids are reused after garbage collection, so forget them with the image
+                self._tracked.add(id(pil_image))
+                weakref.finalize(pil_image, self._forget, id(pil_image))
+            self._thumbnails[key] = thumbnail
+        return thumbnail
+
+    def _forget(self, image_id):
+        with self._lock:
+            self._tracked.discard(image_id)
+            for key in [key for key in self._thumbnails if key[0] == image_id]:
+                del self._thumbnails[key]
+
+
+def render_thumbnail(pil_image, size=THUMBNAIL_SIZE):
+    """Scales a PIL image to fit in ``size`` x ``size`` and wraps it as a QImage."""
+    scale = min(size / pil_image.width, size / pil_image.height, 1)
+    target = (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale)))
+    # Downscale on the PIL side first so only the thumbnail's pixels are copied into Qt
+    small = pil_image.resize(target, Image.LANCZOS, reducing_gap=2.0)
+    qimage, _buffer = wrap_pil_image(small)
+    return qimage.copy()
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def make_thumbnail(pil_image, size=THUMBNAIL_SIZE):
+    """Returns a QImage thumbnail of ``pil_image`` that fits in ``size`` x ``size``."""
+    return thumbnail_cache.get(pil_image, size)
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import typing
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from model_backend import upstream_stats
+from recipe_generator import Recipe, generate_recipe_from_prompt
+
+# Extensions of the files picked up from a folder
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Defaults for the command line and run_batch
+RECIPE_BATCH_WORKERS = int(os.getenv("RECIPE_BATCH_WORKERS", "4"))
+RECIPE_BATCH_RATE = float(os.getenv("RECIPE_BATCH_RATE", "0"))
+
+
+def find_images(folder, recursive=True):
+    """Returns the image files in ``folder`` as paths relative to it, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), folder))
+        if not recursive:
+            break
+    return found
+
+
+def validate_recipes(text):
+    """Parses a model answer and checks it is a list of ``Recipe`` dicts; raises ValueError if not."""
+    recipes = json.loads(text)
+    if not isinstance(recipes, list):
+        raise ValueError("Recipe answer is not a JSON list")
+    for recipe in recipes:
+        if not isinstance(recipe, dict):
+            raise ValueError("Recipe is not a JSON object")
+        for field, field_type in typing.get_type_hints(Recipe).items():
+            value = recipe.get(field)
+            if typing.get_origin(field_type) is list:
+                valid = isinstance(value, list) and all(isinstance(item, str) for item in value)
+            else:
+                valid = isinstance(value, field_type)
+            if not valid:
+                raise ValueError(f"Recipe field {field!r} is missing or not {field_type}")
+    return recipes
+
+
+def load_checkpoint(output_path):
+    """Returns the images already recorded in ``output_path``.
+
+    The output file is the checkpoint: a line is written only once an image
+    is done, so a half-written last line from a crash is cut off here and that
+    image runs again.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    done = set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            f.truncate(len(complete))
+    for line in complete.decode("utf-8").splitlines():
+        try:
+            done.add(json.loads(line)["image"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+class RateLimiter:
+    """Spaces out calls to at most ``per_minute`` a minute across threads (``0`` for no limit)."""
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute if per_minute else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_batch(folder, output_path, workers=RECIPE_BATCH_WORKERS, rate=RECIPE_BATCH_RATE, recursive=True, progress=None):
+    """Generates recipes for every image in ``folder`` and appends them to ``output_path`` as JSONL.
+
+    Each line is ``{"image": <path relative to folder>, "recipes": [...]}``.
+    Images already in the output are skipped, so an interrupted run resumes
+    where it stopped; images that fail are left out and retried next time.
+    ``workers`` images are processed at once and at most ``rate`` are started
+    per minute. ``progress`` is an optional callback that receives a status
+    message after each image. On Ctrl+C, images not started yet are
+    cancelled and the images in flight are not waited for. Returns a
+    summary dict.
+    """
+    images = find_images(folder, recursive)
+    done = load_checkpoint(output_path)
+    pending = [image for image in images if image not in done]
+    limiter = RateLimiter(rate)
+
+    def process(image):
+        limiter.wait()
+        text = generate_recipe_from_prompt(os.path.join(folder, image))
+        return validate_recipes(text)
+
+    summary = {"images": len(images), "skipped": len(images) - len(pending), "done": 0, "failed": 0}
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            futures = {executor.submit(process, image): image for image in pending}
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    recipes = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    print(f"Failed {image}: {str(e)}", file=sys.stderr)
+                else:
+                    summary["done"] += 1
+                    output.write(json.dumps({"image": image, "recipes": recipes}, ensure_ascii=False) + "\n")
+                    output.flush()
+                    os.fsync(output.fileno())
+
+                finished = summary["done"] + summary["failed"]
+                elapsed = time.monotonic() - started
+                per_minute = finished / elapsed * 60 if elapsed else 0
+                remaining = (len(pending) - finished) / per_minute * 60 if per_minute else 0
+                message = (
+                    f"[{finished}/{len(pending)}] {per_minute:.1f} images/min, "
+                    f"{summary['failed']} failed, ETA {remaining:.0f}s"
+                )
+                if progress:
+                    progress(message)
+    except BaseException:
+        # Leaving the with-block of the executor would wait for every queued image
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    summary["seconds"] = time.monotonic() - started
+    summary["images_per_minute"] = (summary["done"] + summary["failed"]) / summary["seconds"] * 60 if summary["seconds"] else 0
+    summary["upstream"] = upstream_stats()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate recipes for a folder of dish photos.")
+    parser.add_argument("folder")
+    parser.add_argument("--output", default="recipes.jsonl", help="JSONL file to append recipes to; also the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=RECIPE_BATCH_WORKERS, help="images processed at once")
+    parser.add_argument("--rate", type=float, default=RECIPE_BATCH_RATE, help="maximum images started per minute (0 for no limit)")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false", help="skip subfolders")
+    args = parser.parse_args()
+    try:
+        summary = run_batch(
+            args.folder, args.output, args.workers, args.rate, args.recursive,
+            progress=lambda message: print(message, flush=True),
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        sys.exit(130)
+    print(json.dumps(summary))
+    sys.exit(1 if summary["failed"] else 0)
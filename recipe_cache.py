@@ -0,0 +1,173 @@
+import os
+import time
+import sqlite3
+import threading
+
+from PIL import Image, ImageOps
+
+# Side of the grid a perceptual hash is computed on; gives a 64-bit hash
+HASH_SIZE = 8
+
+
+def image_hash(image_path):
+    """Computes a 64-bit difference hash (dHash) of an image.
+
+    Each bit says whether a pixel of the downscaled grayscale image is brighter
+    than its right neighbour, so recompressions, resizes and small crops of the
+    same photo give hashes a few bits apart.
+    """
+    with Image.open(image_path) as image:
+        # Lets JPEG decode at a fraction of full size, which is all the hash needs
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image)
+        small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Index of 64-bit hashes for lookups within a Hamming distance.
+
+    Each hash is split into ``max_distance + 1`` chunks with a table per chunk.
+    Two hashes at most ``max_distance`` bits apart must agree exactly on at
+    least one chunk, so a search only compares the query against hashes that
+    share a chunk with it rather than against every stored hash.
+    """
+
+    def __init__(self, max_distance, bits=HASH_SIZE * HASH_SIZE):
+        if not 0 <= max_distance < bits:
+            raise ValueError(f"max_distance must be between 0 and {bits - 1}")
+        self.max_distance = max_distance
+        count = max_distance + 1
+        # (shift, mask) of each chunk, spreading the remainder over the first chunks
+        self.chunks = []
+        shift = 0
+        for index in range(count):
+            width = bits // count + (index < bits % count)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.chunks]
+        self.values = []
+        self.items = []
+
+    def add(self, value, item):
+        """Adds ``item`` under the hash ``value``."""
+        position = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table.setdefault((value >> shift) & mask, []).append(position)
+
+    def search(self, value, max_distance=None):
+        """Returns ``(distance, item)`` pairs within ``max_distance`` of ``value``, nearest first."""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        seen = set()
+        found = []
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            for position in table.get((value >> shift) & mask, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = hamming_distance(value, self.values[position])
+                if distance <= max_distance:
+                    found.append((distance, self.items[position]))
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def __len__(self):
+        return len(self.values)
+
+
+class RecipeCache:
+    """Recipes keyed by the perceptual hash of their photo.
+
+    A lookup returns the recipe of the nearest cached photo within
+    ``max_distance`` bits (``-1`` disables the cache), found through a
+    multi-index hash table so it stays fast with hundreds of thousands of
+    entries. Recipes are kept in a SQLite file at ``path`` and loaded into the
+    index on first use; ``path=None`` keeps them in memory only.
+    """
+
+    def __init__(self, path=None, max_distance=6):
+        self.path = path
+        self.max_distance = max_distance
+
+        self._hashes = None
+        self._lock = threading.Lock()
+
+        # Opened lazily and per process, like the translation cache
+        self._connection = None
+        self._connection_pid = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if not self.path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Hashes are stored as hex since SQLite integers are signed 64-bit
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS recipes ("
+                "id INTEGER PRIMARY KEY, phash TEXT NOT NULL, recipe TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _index(self):
+        if self._hashes is None:
+            self._hashes = MultiIndexHash(self.max_distance)
+            db = self._db()
+            if db is not None:
+                for phash, recipe in db.execute("SELECT phash, recipe FROM recipes ORDER BY id"):
+                    self._hashes.add(int(phash, 16), recipe)
+        return self._hashes
+
+    def get(self, phash):
+        """Returns ``(recipe, distance)`` for the nearest match of ``phash``, or ``None``."""
+        if self.max_distance < 0:
+            return None
+        with self._lock:
+            matches = self._index().search(phash, self.max_distance)
+            if not matches:
+                self.misses += 1
+                return None
+            self.hits += 1
+            distance, recipe = matches[0]
+            return recipe, distance
+
+    def set(self, phash, recipe):
+        """Stores the recipe generated for a photo with hash ``phash``."""
+        if self.max_distance < 0:
+            return
+        with self._lock:
+            self._index().add(phash, recipe)
+            db = self._db()
+            if db is not None:
+                db.execute(
+                    "INSERT INTO recipes (phash, recipe, created) VALUES (?, ?, ?)",
+                    (f"{phash:016x}", recipe, time.time()),
+                )
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._hashes) if self._hashes is not None else 0,
+            }
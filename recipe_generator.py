@@ -1,16 +1,51 @@
 import os
-import google.generativeai as genai
+import json
+import time
+import hashlib
+import mimetypes
+import threading
+from io import BytesIO
+from PIL import Image, ImageOps
 from dotenv import load_dotenv
+from model_backend import lazy_text_model, upload_file
+from upload_index import UploadIndex
+from recipe_cache import RecipeCache, image_hash
 import typing_extensions as typing
 
 # Load environment variables from .env
 load_dotenv()
 
-# Configure the API key for Google Generative AI
-genai.configure(api_key=os.getenv("API_KEY"))
+# Define the recipe generation model; it is created on first use, on the
+# backend selected by MODEL_BACKEND
+recipe_model = lazy_text_model("gemini-1.5-flash")
 
-# Define the recipe generation model
-recipe_model = genai.GenerativeModel("gemini-1.5-flash")
+# Images are downsized to this many pixels on their longest side and re-encoded before upload
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv("RECIPE_IMAGE_MAX_SIZE", "1536"))
+RECIPE_IMAGE_QUALITY = int(os.getenv("RECIPE_IMAGE_QUALITY", "85"))
+
+# Content hashes of images that are already uploaded, so resubmitted photos skip the upload
+upload_index = UploadIndex(os.getenv("RECIPE_UPLOAD_INDEX_PATH", "upload_index.db") or None)
+
+# Assumed lifetime of an uploaded file when the API doesn't report its expiry
+UPLOAD_LIFETIME = 47 * 60 * 60
+
+# Recipes of earlier photos, matched by perceptual hash so near-identical photos skip the model
+recipe_cache = RecipeCache(
+    os.getenv("RECIPE_CACHE_PATH", "recipe_cache.db") or None,
+    max_distance=int(os.getenv("RECIPE_CACHE_DISTANCE", "6")),
+)
+
+# Running totals of what preprocessing and upload dedup saved
+upload_stats = {
+    "uploads": 0,
+    "reused": 0,
+    "bytes_original": 0,
+    "bytes_uploaded": 0,
+    "bytes_saved": 0,
+    "upload_seconds": 0.0,
+    "upload_seconds_saved": 0.0,
+}
+upload_stats_lock = threading.Lock()
 
 # Define the TypedDict for the recipe response schema
 class Recipe(typing.TypedDict):
@@ -18,20 +53,123 @@ class Recipe(typing.TypedDict):
     ingredients: list[str]
     instructions: list[str]
 
-def generate_recipe_from_prompt(image_path):
-    """Generates a recipe based on the provided image."""
+def format_bytes(size):
+    """Formats a byte count for log messages."""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def prepare_image(data, image_path):
+    """Downsizes and re-encodes an image for upload; returns (bytes, mime_type).
+
+    The original bytes are kept when the image is already small enough and
+    re-encoding would not make it smaller.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > RECIPE_IMAGE_MAX_SIZE
+        if resized:
+            image.thumbnail((RECIPE_IMAGE_MAX_SIZE, RECIPE_IMAGE_MAX_SIZE), Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=RECIPE_IMAGE_QUALITY, optimize=True)
+
+    prepared = output.getvalue()
+    if not resized and len(prepared) >= len(data):
+        return data, mimetypes.guess_type(image_path)[0] or "image/jpeg"
+    return prepared, "image/jpeg"
+
+def upload_image(image_path):
+    """Uploads an image for a recipe prompt, reusing an earlier upload of the same content.
+
+    Returns the file to put in the prompt and a message reporting what was saved.
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+
+    # The settings are part of the key so changing them triggers a fresh upload
+    digest = hashlib.sha256(data)
+    digest.update(f"{RECIPE_IMAGE_MAX_SIZE}:{RECIPE_IMAGE_QUALITY}".encode())
+    digest = digest.hexdigest()
+
+    entry = upload_index.get(digest)
+    if entry is not None:
+        with upload_stats_lock:
+            upload_stats["reused"] += 1
+            upload_stats["bytes_original"] += len(data)
+            upload_stats["bytes_saved"] += len(data)
+            # Estimate the time saved from the average upload speed so far
+            if upload_stats["bytes_uploaded"]:
+                upload_stats["upload_seconds_saved"] += len(data) * upload_stats["upload_seconds"] / upload_stats["bytes_uploaded"]
+        myfile = {"file_data": {"file_uri": entry["uri"], "mime_type": entry["mime_type"]}}
+        return myfile, f"Reused uploaded image {entry['name']} (saved {format_bytes(len(data))})"
+
+    prepared, mime_type = prepare_image(data, image_path)
+    started = time.perf_counter()
+    myfile = upload_file(BytesIO(prepared), mime_type=mime_type, display_name=os.path.basename(image_path))
+    elapsed = time.perf_counter() - started
+
+    expiration_time = getattr(myfile, "expiration_time", None)
+    expires = expiration_time.timestamp() if expiration_time else time.time() + UPLOAD_LIFETIME
+    upload_index.put(digest, myfile.name, myfile.uri, mime_type, expires)
+
+    with upload_stats_lock:
+        upload_stats["uploads"] += 1
+        upload_stats["bytes_original"] += len(data)
+        upload_stats["bytes_uploaded"] += len(prepared)
+        upload_stats["bytes_saved"] += len(data) - len(prepared)
+        upload_stats["upload_seconds"] += elapsed
+    return myfile, (
+        f"Uploaded {format_bytes(len(prepared))} of {format_bytes(len(data))} "
+        f"in {elapsed:.2f}s (saved {format_bytes(len(data) - len(prepared))})"
+    )
+
+def generate_recipe_from_prompt(image_path, progress=None):
+    """Generates a recipe based on the provided image.
+
+    ``progress`` is an optional callback that receives a message per step.
+    """
     try:
-        myfile = genai.upload_file(image_path)
+        phash = image_hash(image_path)
+        cached = recipe_cache.get(phash)
+        if cached is not None:
+            recipe, distance = cached
+            print(f"Recipe cache hit for {image_path} (distance {distance})")
+            if progress:
+                progress(f"Found cached recipe of a matching photo (distance {distance})")
+            return recipe
+
+        if progress:
+            progress("Uploading image...")
+        myfile, upload_report = upload_image(image_path)
         print(f"{myfile=}")
+        print(upload_report)
+
+        if progress:
+            progress(upload_report)
+
+        if progress:
+            progress("Generating recipe...")
 
         result = recipe_model.generate_content(
             [myfile, "\n\n", "Given this image:\n\nFirst, describe the image\n\nThen, detail the recipe to cook this food in JSON format. Include item names and quantities for the recipe, as well as step-by-step cooking instructions."],
-            generation_config=genai.GenerationConfig(
-                response_mime_type="application/json",
-                response_schema=list[Recipe]
-            )
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": list[Recipe],
+            }
         )
 
+        # Only well-formed answers are worth serving again
+        try:
+            json.loads(result.text)
+        except ValueError:
+            pass
+        else:
+            recipe_cache.set(phash, result.text)
+
         return result.text
     except Exception as e:
         raise Exception(f"Error generating recipe: {str(e)}")
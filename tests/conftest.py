@@ -0,0 +1,7 @@
+import os
+
+# Set before the translator is imported: stub model, and no database files written by the tests
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ.setdefault("API_KEY", "stub")
+for setting in ("TRANSLATION_CACHE_PATH", "TRANSLATION_TERMS_PATH", "TRANSLATION_MEMORY_PATH", "TRANSLATION_GLOSSARY_PATH"):
+    os.environ[setting] = ""
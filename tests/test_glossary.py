@@ -0,0 +1,64 @@
+import auto_translator
+
+from glossary import Glossary
+
+
+def make_glossary(tmp_path, monkeypatch):
+    glossary = Glossary(str(tmp_path / "glossary.tsv"), str(tmp_path / "terms.db"), reload_interval=0)
+    monkeypatch.setattr(auto_translator, "glossary", glossary)
+    return glossary
+
+
+def settle(glossary):
+    """Picks up changes and waits for the automata rebuilt in the background."""
+    glossary._refresh()
+    builder = glossary._builder
+    if builder is not None:
+        builder.join()
+
+
+def test_single_characters_are_not_harvested(tmp_path, monkeypatch):
+    glossary = make_glossary(tmp_path, monkeypatch)
+    glossary.harvest("是", "Yes")
+    glossary.harvest("龙王", "Dragon King")
+
+    assert glossary.lookup("是") is None
+    assert glossary.lookup("龙王") == "Dragon King"
+    assert "是 = " not in auto_translator.generate_prompt("他是龙王")
+
+
+def test_harvested_terms_keep_the_cache_key(tmp_path, monkeypatch):
+    glossary = make_glossary(tmp_path, monkeypatch)
+    key = auto_translator.translation_key("勇者向龙王发起了攻击")
+
+    glossary.harvest("龙王", "Dragon King")
+    settle(glossary)
+    assert "龙王 = Dragon King" in auto_translator.generate_prompt("勇者向龙王发起了攻击")
+    assert auto_translator.translation_key("勇者向龙王发起了攻击") == key
+
+    (tmp_path / "glossary.tsv").write_text("龙王\tDemon Lord\n", encoding="utf-8")
+    settle(glossary)
+    assert auto_translator.translation_key("勇者向龙王发起了攻击") != key
+
+
+def test_refresh_reads_only_new_harvested_rows(tmp_path, monkeypatch):
+    glossary = make_glossary(tmp_path, monkeypatch)
+    glossary.harvest("龙王", "Dragon King")
+    settle(glossary)
+    assert glossary.matches(["龙王殿"]) == [("龙王", "Dragon King")]
+
+    glossary.harvest("龙王殿", "Dragon Palace")
+    # The new term answers exact lookups at once, before the automata are rebuilt
+    assert glossary.lookup("龙王殿") == "Dragon Palace"
+    settle(glossary)
+    assert glossary.matches(["龙王殿"]) == [("龙王殿", "Dragon Palace")]
+    assert glossary.harvested_terms == 2
+
+
+def test_harvested_terms_do_not_shadow_user_terms_in_the_key(tmp_path, monkeypatch):
+    glossary = make_glossary(tmp_path, monkeypatch)
+    (tmp_path / "glossary.tsv").write_text("龙王\tDemon Lord\n", encoding="utf-8")
+    glossary.harvest("龙王殿", "Dragon Palace")
+    settle(glossary)
+
+    assert glossary.matches(["进入龙王殿"], harvested=False) == [("龙王", "Demon Lord")]
@@ -0,0 +1,68 @@
+import time
+
+import gevent
+
+import model_backend
+
+from concurrency import UpstreamPool
+from model_backend import LazyModel, StubBackend, set_backend
+
+
+def longest_hub_stall(fn):
+    """Runs ``fn`` in a greenlet and returns the longest gap between ticks of another greenlet."""
+    gaps = []
+
+    def tick():
+        last = time.perf_counter()
+        while True:
+            gevent.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = gevent.spawn(tick)
+    gevent.spawn(fn).get()
+    ticker.kill()
+    return max(gaps)
+
+
+def test_context_cache_is_created_off_the_hub():
+    backend = StubBackend(latency=0.3)
+    set_backend(backend)
+    model = LazyModel("text", "stub", "Translate.", cache_ttl=600)
+    upstream = UpstreamPool()
+
+    stall = longest_hub_stall(lambda: upstream.apply(model.generate_content, "你好"))
+
+    # Creating the cache and the call itself each take 0.3 s
+    assert backend.calls == 2
+    assert stall < 0.1
+
+
+def test_renewed_context_cache_is_deleted(monkeypatch):
+    monkeypatch.setattr(model_backend, "CONTEXT_CACHE_GRACE", 0)
+    backend = StubBackend()
+    set_backend(backend)
+    model = LazyModel("text", "stub", "Translate.", cache_ttl=600)
+    model.generate_content("你好")
+
+    # Expire the cached model so the next call renews it
+    key = ("text", "stub", "Translate.", 600)
+    model_backend._models[key] = (model_backend._models[key][0], time.monotonic())
+    model.generate_content("你好")
+
+    deadline = time.monotonic() + 2
+    while not backend.deleted_caches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.deleted_caches == 1
+
+
+def test_rate_budgets_are_split_between_processes(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_REQUESTS_PER_MINUTE", "120")
+    monkeypatch.setenv("UPSTREAM_TOKENS_PER_MINUTE", "60000")
+    monkeypatch.setenv("UPSTREAM_PROCESSES", "4")
+
+    guard = model_backend.create_guard()
+
+    assert guard.requests.rate * 60 == 30
+    assert guard.tokens.rate * 60 == 15000
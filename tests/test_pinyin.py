@@ -0,0 +1,215 @@
+"""Equivalence of convert_pinyin_to_english with the original replace-loop implementation."""
+import random
+
+import pypinyin
+import pytest
+
+from auto_translator import convert_pinyin_to_english
+
+# Tone-marked and ü-bearing samples, plain English and mixed Chinese model output
+CORPUS = [
+    "Welcome back, adventurer!",
+    "Lǐ Bái wrote poems about the moon.",
+    "Zhāng Sān met Lǚ Bù at Chángān.",
+    "Nǚ Wā mended the sky; Lüè and lǘ are rare.",
+    "Obtained 3 gold coins",
+    "Sword of 青龙 (Qīnglóng)",
+    "<color=#ff0000>Warning</color>: HP below 10%",
+    "你好，世界",
+    "Dà Hēi Shān and the Yùlóng river",
+    "ÀÉÎÕÜ ā á ǎ à ē é ě è ī í ǐ ì ō ó ǒ ò ū ú ǔ ù ǖ ǘ ǚ ǜ ü",
+    "Press {0} to open the 背包 inventory",
+    "",
+    "〇 ㄅ 𠀀 漢字 한국어 日本語",
+]
+
+
+def legacy_convert_pinyin_to_english(pinyin):
+    """The original replace-loop implementation, kept as the reference."""
+    english = pypinyin.pinyin(pinyin, style=pypinyin.NORMAL)
+    english = ''.join([i[0] for i in english])
+
+    pinyin_to_english_map = {
+        'ü': 'u',
+        'üe': 'ue',
+        'üi': 'ui',
+        'üo': 'uo',
+        'üa': 'ua',
+        'üe': 'ue',
+        'üai': 'uai',
+        'üao': 'uao',
+        'üan': 'uan',
+        'üang': 'uang',
+        'üe': 'ue',
+        'üei': 'uei',
+        'üo': 'uo',
+        'üai': 'uai',
+        'üao': 'uao',
+        'üan': 'uan',
+        'üang': 'uang',
+        'ā': 'a',
+        'ǎ': 'a',
+        'à': 'a',
+        'á': 'a',
+        'ē': 'e',
+        'ě': 'e',
+        'è': 'e',
+        'é': 'e',
+        'ī': 'i',
+        'ǐ': 'i',
+        'ì': 'i',
+        'í': 'i',
+        'ō': 'o',
+        'ǒ': 'o',
+        'ò': 'o',
+        'ó': 'o',
+        'ū': 'u',
+        'ǔ': 'u',
+        'ù': 'u',
+        'ú': 'u',
+        'ǖ': 'u',
+        'ǘ': 'u',
+        'ǚ': 'u',
+        'ǜ': 'u',
+        'āi': 'ai',
+        'ǎi': 'ai',
+        'ài': 'ai',
+        'ái': 'ai',
+        'ēi': 'ei',
+        'ěi': 'ei',
+        'èi': 'ei',
+        'éi': 'ei',
+        'īi': 'ii',
+        'ǐi': 'ii',
+        'ìi': 'ii',
+        'íi': 'ii',
+        'ōi': 'oi',
+        'ǒi': 'oi',
+        'òi': 'oi',
+        'ói': 'oi',
+        'ūi': 'ui',
+        'ǔi': 'ui',
+        'ùi': 'ui',
+        'úi': 'ui',
+        'ǖi': 'ui',
+        'ǘi': 'ui',
+        'ǚi': 'ui',
+        'ǜi': 'ui',
+        'āu': 'au',
+        'ǎu': 'au',
+        'àu': 'au',
+        'áu': 'au',
+        'ēu': 'eu',
+        'ěu': 'eu',
+        'èu': 'eu',
+        'éu': 'eu',
+        'īu': 'iu',
+        'ǐu': 'iu',
+        'ìu': 'iu',
+        'íu': 'iu',
+        'ōu': 'ou',
+        'ǒu': 'ou',
+        'òu': 'ou',
+        'óu': 'ou',
+        'ūu': 'uu',
+        'ǔu': 'uu',
+        'ùu': 'uu',
+        'úu': 'uu',
+        'ǖu': 'uu',
+        'ǘu': 'uu',
+        'ǚu': 'uu',
+        'ǜu': 'uu',
+        'āng': 'ang',
+        'ǎng': 'ang',
+        'àng': 'ang',
+        'áng': 'ang',
+        'ēng': 'eng',
+        'ěng': 'eng',
+        'èng': 'eng',
+        'éng': 'eng',
+        'īng': 'ing',
+        'ǐng': 'ing',
+        'ìng': 'ing',
+        'íng': 'ing',
+        'ōng': 'ong',
+        'ǒng': 'ong',
+        'òng': 'ong',
+        'óng': 'ong',
+        'ūng': 'ung',
+        'ǔng': 'ung',
+        'ùng': 'ung',
+        'úng': 'ung',
+        'ǖng': 'ung',
+        'ǘng': 'ung',
+        'ǚng': 'ung',
+        'ǜng': 'ung',
+        'ān': 'an',
+        'ǎn': 'an',
+        'àn': 'an',
+        'án': 'an',
+        'ēn': 'en',
+        'ěn': 'en',
+        'èn': 'en',
+        'én': 'en',
+        'īn': 'in',
+        'ǐn': 'in',
+        'ìn': 'in',
+        'ín': 'in',
+        'ōn': 'on',
+        'ǒn': 'on',
+        'òn': 'on',
+        'ón': 'on',
+        'ūn': 'un',
+        'ǔn': 'un',
+        'ùn': 'un',
+        'ún': 'un',
+        'ǖn': 'un',
+        'ǘn': 'un',
+        'ǚn': 'un',
+        'ǜn': 'un',
+        'āng': 'ang',
+        'ǎng': 'ang',
+        'àng': 'ang',
+        'áng': 'ang',
+        'ēng': 'eng',
+        'ěng': 'eng',
+        'èng': 'eng',
+        'éng': 'eng',
+        'īng': 'ing',
+        'ǐng': 'ing',
+        'ìng': 'ing',
+        'íng': 'ing',
+        'ōng': 'ong',
+        'ǒng': 'ong',
+        'òng': 'ong',
+        'óng': 'ong',
+        'ūng': 'ung',
+        'ǔng': 'ung',
+        'ùng': 'ung',
+        'úng': 'ung',
+        'ǖng': 'ung',
+        'ǘng': 'ung',
+        'ǚng': 'ung',
+        'ǜng': 'ung',
+    }
+
+    for pinyin_char, english_char in pinyin_to_english_map.items():
+        english = english.replace(pinyin_char, english_char)
+
+    return english
+
+
+def random_corpus(size, seed=0):
+    """Builds a reproducible corpus by splicing the samples together."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(CORPUS, k=rng.randint(1, 4))) for _ in range(size)]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_matches_legacy_on_samples(text):
+    assert convert_pinyin_to_english(text) == legacy_convert_pinyin_to_english(text)
+
+
+def test_matches_legacy_on_spliced_corpus():
+    for text in random_corpus(2000):
+        assert convert_pinyin_to_english(text) == legacy_convert_pinyin_to_english(text), text
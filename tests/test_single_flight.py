@@ -0,0 +1,45 @@
+import gevent
+
+import auto_translator
+
+from concurrency import SingleFlight, UpstreamPool
+from model_backend import StubBackend, set_backend
+
+
+def test_concurrent_identical_requests_make_one_upstream_call():
+    # Slow enough that every request arrives while the first is still in flight
+    backend = StubBackend(latency=0.2)
+    set_backend(backend)
+    client = auto_translator.app.test_client()
+
+    responses = gevent.joinall(
+        [gevent.spawn(client.get, "/translate", query_string={"text": "同时到达的相同请求"}) for _ in range(20)],
+        raise_error=True,
+    )
+
+    assert backend.calls == 1
+    assert auto_translator.inflight.followers >= 19
+    assert {(greenlet.value.status_code, greenlet.value.get_data(as_text=True)) for greenlet in responses} == {
+        (200, auto_translator.convert_pinyin_to_english("EN:同时到达的相同请求"))
+    }
+
+
+def test_followers_survive_a_killed_leader():
+    backend = StubBackend(latency=0.2)
+    set_backend(backend)
+    flight = SingleFlight()
+    upstream = UpstreamPool()
+
+    def call():
+        return upstream.apply(backend.text_model("stub").generate_content, "被终止的领头请求").text
+
+    leader = gevent.spawn(flight.do, "key", call)
+    gevent.sleep(0.05)
+    followers = [gevent.spawn(flight.do, "key", call) for _ in range(5)]
+    gevent.sleep(0.05)
+    leader.kill()
+    gevent.joinall(followers, raise_error=True)
+
+    assert {follower.value for follower in followers} == {"EN:被终止的领头请求"}
+    # The killed leader's call and one rerun for all the followers
+    assert backend.calls == 2
@@ -0,0 +1,39 @@
+import time
+
+from translation_cache import TranslationCache
+
+
+def age_rows(cache, seconds):
+    cache._db().execute("UPDATE translations SET created = created - ?", (seconds,))
+
+
+def test_ttl_expires_rows_on_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = TranslationCache(path, ttl=60)
+    cache.set("key", "value")
+    age_rows(cache, 120)
+    cache._entries.clear()
+
+    assert cache.get("key") is None
+    assert cache._db().execute("SELECT COUNT(*) FROM translations").fetchone()[0] == 0
+
+
+def test_expired_rows_are_purged_when_the_file_is_opened(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = TranslationCache(path)
+    writer.set("old", "value")
+    age_rows(writer, 120)
+    writer.set("new", "value")
+
+    reader = TranslationCache(path, ttl=60)
+    assert reader.get("new") == "value"
+    assert reader._db().execute("SELECT key FROM translations").fetchall() == [("new",)]
+
+
+def test_rows_are_kept_without_ttl(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = TranslationCache(path)
+    cache.set("key", "value")
+    age_rows(cache, time.time())
+
+    assert TranslationCache(path).get("key") == "value"
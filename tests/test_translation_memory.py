@@ -0,0 +1,46 @@
+import auto_translator
+
+from glossary import Glossary
+from model_backend import StubBackend, set_backend
+from translation_cache import TranslationCache
+from translation_memory import TranslationMemory
+
+
+def use_fresh_state(tmp_path, monkeypatch):
+    """Gives the translator an empty cache, memory and glossary, and a stub model; returns the stub."""
+    monkeypatch.setattr(auto_translator, "cache", TranslationCache())
+    monkeypatch.setattr(auto_translator, "memory", TranslationMemory())
+    monkeypatch.setattr(auto_translator, "glossary", Glossary(str(tmp_path / "glossary.tsv"), reload_interval=0))
+    backend = StubBackend()
+    set_backend(backend)
+    return backend
+
+
+def test_variants_reuse_a_template(tmp_path, monkeypatch):
+    backend = use_fresh_state(tmp_path, monkeypatch)
+
+    assert auto_translator.translate_text("获得 3 金币") == "EN:huode 3 jinbi"
+    assert auto_translator.translate_text("获得 12 金币") == "EN:huode 12 jinbi"
+    assert backend.calls == 1
+
+
+def test_lines_without_values_are_only_examples(tmp_path, monkeypatch):
+    backend = use_fresh_state(tmp_path, monkeypatch)
+    auto_translator.memory.reuse_threshold = 0.3
+    auto_translator.translate_text("李逍遥加入了队伍，一起踏上旅程")
+
+    prompt = auto_translator.generate_prompt("赵灵儿加入了队伍，一起踏上旅程")
+    assert "Similar:\n李逍遥加入了队伍，一起踏上旅程 = EN:" in prompt
+    auto_translator.translate_text("赵灵儿加入了队伍，一起踏上旅程")
+    assert backend.calls == 2
+
+
+def test_glossary_edit_is_not_answered_from_memory(tmp_path, monkeypatch):
+    backend = use_fresh_state(tmp_path, monkeypatch)
+    auto_translator.translate_text("龙王造成 30 点伤害")
+
+    (tmp_path / "glossary.tsv").write_text("龙王\tDragon King\n", encoding="utf-8")
+    auto_translator.translate_text("龙王造成 45 点伤害")
+
+    assert auto_translator.memory.template_hits == 0
+    assert backend.calls == 2
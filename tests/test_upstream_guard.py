@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from concurrency import AsyncUpstreamPool, UpstreamTimeout
+from upstream_guard import CircuitOpen, UpstreamGuard
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_cancelled_probe_does_not_leave_the_breaker_half_open():
+    guard = UpstreamGuard(breaker_threshold=1, breaker_reset=0.1, max_retries=0)
+
+    async def fail():
+        raise RateLimited()
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def succeed():
+        return "ok"
+
+    async def run():
+        with pytest.raises(RateLimited):
+            await guard.call_async(fail)
+        assert guard.breaker.state == "open"
+        await asyncio.sleep(0.15)
+
+        # The half-open probe times out in the pool and is cancelled
+        pool = AsyncUpstreamPool(timeout=0.05)
+        with pytest.raises(UpstreamTimeout):
+            await pool.apply(guard.call_async, hang)
+        assert guard.breaker.state == "open"
+
+        await asyncio.sleep(0.15)
+        return await guard.call_async(succeed)
+
+    assert asyncio.run(run()) == "ok"
+    assert guard.breaker.state == "closed"
+
+
+def test_unanswered_probe_expires():
+    guard = UpstreamGuard(breaker_threshold=1, breaker_reset=0.05)
+    guard.breaker.record_failure()
+    guard.breaker.reset_timeout = 0
+    guard.breaker.probe_timeout = 0
+    guard.breaker.before_call()
+    assert guard.breaker.state == "half_open"
+
+    # The probe's outcome never arrives; the next call starts a new probe instead of failing forever
+    guard.breaker.before_call()
+    assert guard.breaker.state == "half_open"
+
+
+def test_retries_wait_for_the_rate_limiter():
+    guard = UpstreamGuard(requests_per_minute=600, max_retries=3, base_delay=0, max_delay=0)
+    guard.requests.tokens = 1
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "ok"
+
+    assert guard.call(flaky) == "ok"
+    # Two of the three attempts found the bucket empty
+    assert guard.stats()["limited"] == 2
+
+
+def test_open_breaker_rejects_calls():
+    guard = UpstreamGuard(breaker_threshold=1, breaker_reset=60, max_retries=0)
+
+    def fail():
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        guard.call(fail)
+    with pytest.raises(CircuitOpen):
+        guard.call(lambda: "ok")
@@ -0,0 +1,26 @@
+import auto_translator
+import xunity_warmup
+
+from glossary import Glossary
+from model_backend import StubBackend, set_backend
+from translation_cache import TranslationCache
+from translation_memory import TranslationMemory
+
+
+def test_summary_counts_each_outcome_once(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(auto_translator, "cache", TranslationCache())
+    monkeypatch.setattr(auto_translator, "memory", TranslationMemory())
+    (tmp_path / "glossary.tsv").write_text("龙王\tDragon King\n", encoding="utf-8")
+    monkeypatch.setattr(auto_translator, "glossary", Glossary(str(tmp_path / "glossary.tsv"), reload_interval=0))
+    set_backend(StubBackend())
+    path = tmp_path / "_AutoGeneratedTranslations.txt"
+    path.write_text("龙王=\n获得 3 金币=\n获得 12 金币=\n", encoding="utf-8")
+
+    summary = xunity_warmup.run_warmup([str(path)], workers=1)
+
+    assert {key: summary[key] for key in ("glossary", "cached", "remembered", "translated", "failed")} == {
+        "glossary": 1, "cached": 0, "remembered": 1, "translated": 1, "failed": 0,
+    }
+    assert auto_translator.cache.misses == 2
+    assert "龙王=Dragon King" in path.read_text(encoding="utf-8")
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,55 @@
+import time
+import random
+import contextvars
+
+from contextlib import contextmanager
+
+# Trace of the request being handled; each greenlet, thread and task has its own
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Named spans of one request, with their start offsets and durations."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def server_timing(self):
+        """Formats the spans as a ``Server-Timing`` header value."""
+        return ", ".join(f"{name};dur={duration * 1000:.2f}" for name, _, duration in self.spans)
+
+    def summary(self):
+        """Formats the trace as one log line."""
+        total = time.perf_counter() - self.started
+        spans = " ".join(f"{name}@{offset * 1000:.1f}+{duration * 1000:.2f}ms" for name, offset, duration in self.spans)
+        return f"trace {self.name} {total * 1000:.2f}ms {spans}".rstrip()
+
+
+def start_trace(name, sample_rate):
+    """Starts tracing the current request with probability ``sample_rate``; returns the trace or ``None``."""
+    if not sample_rate or random.random() >= sample_rate:
+        _current.set(None)
+        return None
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Records the ``with`` block as a span of the current trace, if the request is traced."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started - trace.started, time.perf_counter() - started))
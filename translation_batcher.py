@@ -0,0 +1,86 @@
+import gevent
+import logging
+
+from gevent.event import AsyncResult
+
+
+class TranslationBatcher:
+    """Packs concurrent translation requests into a single upstream call.
+
+    Requests are collected for up to ``max_wait`` seconds or until
+    ``max_batch_size`` texts are pending, then sent together through
+    ``translate_batch(texts)``, which must return a list of translations in the
+    same order. A lone text goes through ``translate_one(text)`` instead, as
+    does every text of a batch whose response does not line up with its input.
+    Must be used from greenlets running in the hub's thread.
+    """
+
+    def __init__(self, translate_batch, translate_one, max_batch_size=16, max_wait=0.005):
+        self.translate_batch = translate_batch
+        self.translate_one = translate_one
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._pending = []
+        self._timer = None
+
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    def submit(self, text):
+        """Queues ``text`` for the next batch and waits for its translation."""
+        if self.max_batch_size <= 1:
+            return self.translate_one(text)
+
+        result = AsyncResult()
+        self._pending.append((text, result))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = gevent.spawn_later(self.max_wait, self._flush)
+        return result.get()
+
+    def _flush(self):
+        if self._timer is not None:
+            # Killing the timer from inside itself would raise GreenletExit here
+            if self._timer is not gevent.getcurrent():
+                self._timer.kill(block=False)
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            gevent.spawn(self._run, batch)
+
+    def _run(self, batch):
+        if len(batch) == 1:
+            self._run_one(*batch[0])
+            return
+
+        texts = [text for text, _ in batch]
+        try:
+            translations = self.translate_batch(texts)
+        except Exception as e:
+            for _, result in batch:
+                result.set_exception(e)
+            return
+
+        if (
+            isinstance(translations, list)
+            and len(translations) == len(texts)
+            and all(isinstance(translation, str) for translation in translations)
+        ):
+            self.batches += 1
+            self.batched_items += len(batch)
+            for (_, result), translation in zip(batch, translations):
+                result.set(translation)
+            return
+
+        logging.warning(f"Batched translation did not line up with {len(texts)} inputs, retrying per item")
+        self.fallbacks += 1
+        gevent.joinall([gevent.spawn(self._run_one, text, result) for text, result in batch])
+
+    def _run_one(self, text, result):
+        try:
+            result.set(self.translate_one(text))
+        except Exception as e:
+            result.set_exception(e)
@@ -0,0 +1,135 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Normalizes source text so trivially different inputs share a cache entry."""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def make_cache_key(text, prompt_template, model_name):
+    """Builds the cache key from the normalized text, prompt template and model name."""
+    digest = hashlib.sha256()
+    for part in (model_name, prompt_template, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class TranslationCache:
+    """Two-tier translation cache: an in-memory LRU in front of a SQLite store.
+
+    The memory tier is bounded by ``max_entries``. The disk tier keeps
+    translations across restarts and refills the memory tier on a hit.
+    Entries older than ``ttl`` seconds are dropped from both tiers, or kept
+    forever with ``ttl=None``. Pass ``path=None`` to run memory-only.
+    """
+
+    def __init__(self, path=None, max_entries=10000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # The SQLite connection is opened lazily and per process, so the cache
+        # survives being created before a fork (e.g. multiprocessing.Process).
+        self._connection = None
+        self._connection_pid = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self):
+        if not self.path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            if self.ttl is not None:
+                # Rows expired while no process had the file open would otherwise stay until read
+                connection.execute("DELETE FROM translations WHERE created <= ?", (time.time() - self.ttl,))
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Returns the cached translation for ``key`` or ``None`` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl is None or now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+
+            db = self._db()
+            if db is not None:
+                row = db.execute("SELECT value, created FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if self.ttl is None or now - created < self.ttl:
+                        self._remember(key, value, created)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    db.execute("DELETE FROM translations WHERE key = ? AND created = ?", (key, created))
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Stores ``value`` in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            db = self._db()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, now),
+                )
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._entries),
+            }
+
+    def close(self):
+        """Closes the disk tier."""
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
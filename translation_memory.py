@@ -0,0 +1,283 @@
+import os
+import re
+import time
+import zlib
+import random
+import hashlib
+import sqlite3
+import threading
+
+from collections import defaultdict
+
+from translation_cache import normalize_text
+
+# Parts of a line that vary between otherwise identical lines and are carried
+# over verbatim: rich-text tags, format placeholders and numbers
+VARIABLE_PATTERN = re.compile(
+    r"<[^<>]+>"
+    r"|\{[^{}]*\}"
+    r"|%(?:\d+\$)?[-+ 0#]*\d*(?:\.\d+)?[sdifx]"
+    r"|\d+(?:[.,:]\d+)*"
+)
+
+# Private-use characters around the index of a masked part; game text does not use them
+SLOT_OPEN = chr(0xE000)
+SLOT_CLOSE = chr(0xE001)
+SLOT_PATTERN = re.compile(SLOT_OPEN + r"(\d+)" + SLOT_CLOSE)
+
+# Mersenne prime for the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def mask(text):
+    """Splits ``text`` into a template with numbered slots and the values masked out of it.
+
+    ``mask("获得 12 金币")`` returns ``("获得 \\ue0000\\ue001 金币", ["12"])``.
+    """
+    values = []
+
+    def slot(match):
+        values.append(match.group(0))
+        return f"{SLOT_OPEN}{len(values) - 1}{SLOT_CLOSE}"
+
+    return VARIABLE_PATTERN.sub(slot, text), values
+
+
+def unmask(template, values):
+    """Fills the slots of ``template`` with ``values``."""
+    return SLOT_PATTERN.sub(lambda match: values[int(match.group(1))], template)
+
+
+def translation_template(values, translation):
+    """Masks a translation with the slots of its source, or returns ``None``.
+
+    Only works when the source has masked values and the translation
+    carries exactly those, each once, so every slot maps back to one source
+    value.
+    """
+    if not values or len(set(values)) != len(values):
+        return None
+    template, translated_values = mask(translation)
+    if sorted(translated_values) != sorted(values):
+        return None
+    order = iter(values.index(value) for value in translated_values)
+    return SLOT_PATTERN.sub(lambda match: f"{SLOT_OPEN}{next(order)}{SLOT_CLOSE}", template)
+
+
+def context_digest(context):
+    """Short digest of what a translation depends on besides its text, e.g. the model and instructions."""
+    return hashlib.sha256("\x00".join(context).encode("utf-8")).hexdigest()[:16]
+
+
+def shingles(template):
+    """Character bigrams of a template, with each slot counted as one character."""
+    text = SLOT_PATTERN.sub(SLOT_OPEN, template)
+    if len(text) < 2:
+        return {text}
+    return {text[index:index + 2] for index in range(len(text) - 1)}
+
+
+class MinHashIndex:
+    """Locality-sensitive index of shingle sets for Jaccard similarity search.
+
+    Each set gets a MinHash signature of ``num_perm`` values split into
+    ``bands``. Sets sharing all values of any band become candidates, which
+    finds pairs above roughly ``(1 / bands) ** (1 / rows)`` similarity.
+    Candidates are then checked against their exact Jaccard similarity.
+    """
+
+    def __init__(self, num_perm=32, bands=16, seed=1):
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME)) for _ in range(num_perm)]
+        self.rows = num_perm // bands
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._sets = {}
+
+    def _bands(self, items):
+        hashes = [zlib.crc32(item.encode("utf-8")) for item in items]
+        signature = [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in self._permutations]
+        return [tuple(signature[index:index + self.rows]) for index in range(0, len(signature), self.rows)]
+
+    def add(self, key, items):
+        if key in self._sets:
+            return
+        self._sets[key] = items
+        for buckets, band in zip(self._buckets, self._bands(items)):
+            buckets[band].append(key)
+
+    def search(self, items, threshold):
+        """Returns ``(similarity, key)`` pairs at or above ``threshold``, most similar first."""
+        candidates = set()
+        for buckets, band in zip(self._buckets, self._bands(items)):
+            candidates.update(buckets.get(band, ()))
+        found = []
+        for key in candidates:
+            other = self._sets[key]
+            similarity = len(items & other) / len(items | other)
+            if similarity >= threshold:
+                found.append((similarity, key))
+        found.sort(reverse=True)
+        return found
+
+    def __len__(self):
+        return len(self._sets)
+
+
+class TranslationMemory:
+    """Template-aware translation memory backed by a SQLite table.
+
+    Numbers, placeholders and rich-text tags are masked out of every
+    translated line, so ``获得 3 金币`` and ``获得 12 金币`` share the template
+    ``获得 {0} 金币``. Its translation template answers every later variant
+    without calling the model. Lines without anything to mask are kept
+    only as examples for ``hints``; repeats of them are left to the cache.
+    Templates are remembered per ``context``, the model,
+    instructions and glossary entries the translation was made with, so a
+    change to any of them is not answered with older translations.
+    Templates are also indexed by MinHash over character bigrams. ``hints``
+    offers the closest earlier translations to the model as examples, and
+    with ``reuse_threshold`` set, a template that similar with the same
+    slots and context is reused as is. Rows written by other processes are
+    picked up every ``reload_interval`` seconds. Pass
+    ``path=None`` to keep the memory in this process only.
+    """
+
+    def __init__(self, path=None, suggest_threshold=0.5, reuse_threshold=0, max_suggestions=3, reload_interval=5):
+        self.path = path
+        self.suggest_threshold = suggest_threshold
+        self.reuse_threshold = reuse_threshold
+        self.max_suggestions = max_suggestions
+        self.reload_interval = reload_interval
+
+        self._templates = {}
+        self._index = MinHashIndex()
+        self._lock = threading.Lock()
+        self._checked = None
+        self._last_rowid = 0
+
+        # Opened lazily and per process, like the translation cache
+        self._connection = None
+        self._connection_pid = None
+
+        self.template_hits = 0
+        self.fuzzy_hits = 0
+        self.suggested = 0
+        self.stored = 0
+
+    def _db(self):
+        if not self.path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS templates ("
+                "context TEXT NOT NULL, template TEXT NOT NULL, translation TEXT NOT NULL, "
+                "source TEXT NOT NULL, example TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (context, template))"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _remember(self, context, template, translation, source, example):
+        self._templates[context, template] = (translation, source, example)
+        self._index.add((context, template), shingles(template))
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+            db = self._db()
+            if db is None:
+                return
+            rows = db.execute(
+                "SELECT rowid, context, template, translation, source, example FROM templates WHERE rowid > ? ORDER BY rowid",
+                (self._last_rowid,),
+            ).fetchall()
+            for rowid, context, template, translation, source, example in rows:
+                self._remember(context, template, translation, source, example)
+                self._last_rowid = rowid
+
+    def lookup(self, text, context=()):
+        """Returns a translation of ``text`` built from a template remembered for ``context``, or ``None``."""
+        self._refresh()
+        template, values = mask(normalize_text(text))
+        if not values:
+            return None
+        context = context_digest(context)
+        entry = self._templates.get((context, template))
+        if entry is not None:
+            self.template_hits += 1
+            return unmask(entry[0], values)
+
+        if self.reuse_threshold and len(self._index):
+            slots = len(values)
+            for similarity, other in self._index.search(shingles(template), self.reuse_threshold):
+                translation = self._templates[other][0]
+                if other[0] == context and len(SLOT_PATTERN.findall(other[1])) == slots:
+                    self.fuzzy_hits += 1
+                    return unmask(translation, values)
+        return None
+
+    def similar(self, text, threshold=None):
+        """Returns earlier ``(similarity, source, translation)`` examples for lines similar to ``text``."""
+        self._refresh()
+        threshold = self.suggest_threshold if threshold is None else threshold
+        if not threshold or not len(self._index):
+            return []
+        template, _ = mask(normalize_text(text))
+        examples = []
+        for similarity, other in self._index.search(shingles(template), threshold):
+            if other[1] != template:
+                _, source, example = self._templates[other]
+                examples.append((similarity, source, example))
+        return examples
+
+    def hints(self, texts):
+        """Formats earlier translations of lines similar to ``texts`` as the block sent before them, or ``""``."""
+        examples = {}
+        for text in texts:
+            for _, source, example in self.similar(text)[:self.max_suggestions]:
+                examples.setdefault(source, example)
+            if len(examples) >= self.max_suggestions:
+                break
+        if not examples:
+            return ""
+        self.suggested += 1
+        lines = list(examples.items())[:self.max_suggestions]
+        return "Similar:\n" + "\n".join(f"{source} = {example}" for source, example in lines)
+
+    def add(self, text, translation, context=()):
+        """Remembers the translation of ``text`` for ``context`` as a template, or as an example if it has no slots."""
+        source = normalize_text(text)
+        template, values = mask(source)
+        context = context_digest(context)
+        # A template without slots is never reused: lookup needs values and fuzzy reuse the same slot count
+        translated = translation_template(values, translation.strip()) if values else translation.strip()
+        if translated is None or (context, template) in self._templates:
+            return
+        with self._lock:
+            self._remember(context, template, translated, source, translation.strip())
+            db = self._db()
+            if db is not None:
+                db.execute(
+                    "INSERT OR IGNORE INTO templates (context, template, translation, source, example, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (context, template, translated, source, translation.strip(), time.time()),
+                )
+        self.stored += 1
+
+    def stats(self):
+        """Returns the memory counters as a dict."""
+        return {
+            "templates": len(self._templates),
+            "template_hits": self.template_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "suggested": self.suggested,
+            "stored": self.stored,
+        }
@@ -0,0 +1,250 @@
+import os
+import time
+import queue
+import _thread
+import threading
+import multiprocessing
+
+from collections import deque
+
+# Restarts allowed after quick crashes before the supervisor gives up
+TRANSLATION_MAX_RESTARTS = int(os.getenv("TRANSLATION_MAX_RESTARTS", "5"))
+# How often the translator process sends its queued events to the GUI
+TRANSLATION_EVENT_INTERVAL_MS = float(os.getenv("TRANSLATION_EVENT_INTERVAL_MS", "250"))
+
+# Events kept per flush; older ones are counted as dropped
+MAX_EVENTS_PER_BATCH = 200
+# A process that ran this long before crashing resets the restart backoff
+STABLE_SECONDS = 60
+# Seconds a process gets to stop on its own before it is terminated
+STOP_TIMEOUT = 10
+
+
+class EventChannel:
+    """Collects per-request events in the translator process and sends them in batches.
+
+    Request handlers only append to a bounded deque; a background thread
+    sends one ``("batch", ...)`` message per interval with the events and
+    throughput since the last one, so the GUI updates once per batch instead
+    of once per request. When the GUI falls behind, batches are dropped
+    rather than queued without bound.
+    """
+
+    def __init__(self, events, interval):
+        self.events = events
+        self.interval = interval
+        self.pending = deque(maxlen=MAX_EVENTS_PER_BATCH)
+        self.requests = 0
+        self.errors = 0
+        self.dropped_events = 0
+        self.dropped = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="translator-events", daemon=True)
+
+    def record(self, event):
+        # Runs on the server thread; deque appends are thread-safe
+        self.requests += 1
+        if event["status"] >= 400:
+            self.errors += 1
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped_events += 1
+        self.pending.append(event)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+    def send(self, kind, payload):
+        try:
+            self.events.put_nowait((kind, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, stats=None):
+        events = []
+        while self.pending:
+            events.append(self.pending.popleft())
+        if events or stats:
+            self.send("batch", {"events": events, "stats": stats})
+
+    def _run(self):
+        from auto_translator import cache, upstream, upstream_stats
+
+        last_requests = 0
+        last_time = time.monotonic()
+        idle = True
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            requests = self.requests
+            if requests == last_requests and idle:
+                last_time = now
+                continue
+            # One more batch after traffic stops, so the GUI sees the rate drop to zero
+            idle = requests == last_requests
+            cache_stats = cache.stats()
+            lookups = cache_stats["hits"] + cache_stats["misses"]
+            stats = {
+                "requests": requests,
+                "errors": self.errors,
+                "requests_per_second": (requests - last_requests) / (now - last_time),
+                "cache_hit_ratio": cache_stats["hits"] / lookups if lookups else 0.0,
+                "upstream_pending": upstream.pending,
+                "upstream_retries": upstream_stats()["retries"],
+                "dropped_events": self.dropped_events,
+                "dropped_batches": self.dropped,
+            }
+            last_requests, last_time = requests, now
+            self.flush(stats)
+
+
+def serve(control, events, server=None, interval=TRANSLATION_EVENT_INTERVAL_MS / 1000):
+    """Entry point of the translator process.
+
+    Runs the translation server and stops it gracefully when ``"stop"``
+    arrives on the ``control`` pipe, or when the pipe closes because the GUI
+    went away. Per-request events and throughput stats go to the ``events``
+    queue.
+    """
+    import gevent
+    import auto_translator
+
+    channel = EventChannel(events, interval)
+    auto_translator.request_listeners.append(channel.record)
+
+    # The gevent server may only be stopped from its own thread, so the
+    # control thread wakes the event loop through an async watcher
+    hub = gevent.get_hub()
+    wakeup = hub.loop.async_()
+    wakeup.start(lambda: gevent.spawn(auto_translator.stop_translation))
+
+    def watch_control():
+        try:
+            control.recv()
+        except (EOFError, OSError):
+            pass
+        if auto_translator.http_server is not None:
+            wakeup.send()
+        else:
+            # The ASGI mode stops on SIGINT like on Ctrl+C
+            _thread.interrupt_main()
+
+    threading.Thread(target=watch_control, name="translator-control", daemon=True).start()
+
+    channel.start()
+    channel.send("started", {"pid": os.getpid(), "server": server or auto_translator.TRANSLATION_SERVER})
+    try:
+        auto_translator.run_translation(server=server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        channel.stop()
+        channel.send("stopped", {"pid": os.getpid()})
+        events.close()
+        # Waits until the queued messages are written to the pipe
+        events.join_thread()
+
+
+class TranslatorSupervisor:
+    """Runs the translator in a child process and restarts it when it crashes.
+
+    ``stop`` asks the process over a pipe to finish the requests in flight
+    and exit, and terminates it only if it does not within ``STOP_TIMEOUT``.
+    ``poll`` must be called regularly (the GUI does it from a timer): it
+    returns the messages the process sent since the last call and restarts
+    a crashed process with exponential backoff, giving up after
+    ``max_restarts`` crashes in a row that each came within a minute of
+    starting.
+    """
+
+    def __init__(self, server=None, max_restarts=TRANSLATION_MAX_RESTARTS, interval=TRANSLATION_EVENT_INTERVAL_MS / 1000):
+        self.server = server
+        self.max_restarts = max_restarts
+        self.interval = interval
+        self.process = None
+        self.control = None
+        self.events = None
+        self.restarts = 0
+        self.crashes = 0
+        self._started_at = 0.0
+        self._restart_at = None
+
+    def is_running(self):
+        return self.process is not None or self._restart_at is not None
+
+    def start(self):
+        """Starts the translator process."""
+        context = multiprocessing.get_context()
+        child_control, self.control = context.Pipe(duplex=False)
+        self.events = context.Queue(maxsize=100)
+        # Not a daemon, so the ASGI mode can start its own worker processes
+        self.process = context.Process(target=serve, args=(child_control, self.events, self.server, self.interval), name="translator")
+        self.process.start()
+        child_control.close()
+        self._started_at = time.monotonic()
+        self._restart_at = None
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stops the translator process gracefully; returns the messages it sent while stopping."""
+        self._restart_at = None
+        if self.process is None:
+            return []
+        try:
+            self.control.send("stop")
+        except (BrokenPipeError, OSError):
+            pass
+        messages = []
+        deadline = time.monotonic() + timeout
+        # Keep draining the queue, a child blocked on a full queue never exits
+        while self.process.is_alive() and time.monotonic() < deadline:
+            messages.extend(self._drain(timeout=0.1))
+        if self.process.is_alive():
+            self.process.terminate()
+            messages.append(("terminated", {"pid": self.process.pid}))
+        self.process.join()
+        messages.extend(self._drain())
+        self._close()
+        return messages
+
+    def poll(self):
+        """Returns the messages received since the last call, restarting the process if it crashed."""
+        messages = self._drain()
+        if self.process is not None and not self.process.is_alive():
+            messages.extend(self._drain())
+            exitcode = self.process.exitcode
+            ran = time.monotonic() - self._started_at
+            self._close()
+            self.crashes = 0 if ran >= STABLE_SECONDS else self.crashes
+            self.crashes += 1
+            if self.crashes > self.max_restarts:
+                messages.append(("gave_up", {"exitcode": exitcode, "crashes": self.crashes}))
+            else:
+                delay = min(30, 2 ** (self.crashes - 1))
+                self._restart_at = time.monotonic() + delay
+                messages.append(("crashed", {"exitcode": exitcode, "restart_in": delay}))
+        if self._restart_at is not None and time.monotonic() >= self._restart_at:
+            self.restarts += 1
+            self.start()
+            messages.append(("restarted", {"pid": self.process.pid, "restarts": self.restarts}))
+        return messages
+
+    def _drain(self, timeout=None):
+        messages = []
+        if self.events is None:
+            return messages
+        try:
+            if timeout:
+                messages.append(self.events.get(timeout=timeout))
+            while True:
+                messages.append(self.events.get_nowait())
+        except (queue.Empty, OSError, EOFError):
+            pass
+        return messages
+
+    def _close(self):
+        self.control.close()
+        self.events.close()
+        self.process = self.control = self.events = None
@@ -0,0 +1,74 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class UploadIndex:
+    """Maps content hashes to files already uploaded to the Gemini API.
+
+    Uploaded files expire (after 48 hours on Gemini), so every entry keeps its
+    expiry and is ignored once it is within ``margin`` seconds of it. Entries
+    live in a SQLite file at ``path``, or only in memory with ``path=None``.
+    """
+
+    def __init__(self, path=None, margin=600):
+        self.path = path
+        self.margin = margin
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        # Opened lazily and per process, like the translation cache
+        self._connection = None
+        self._connection_pid = None
+
+    def _db(self):
+        if not self.path:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "digest TEXT PRIMARY KEY, name TEXT NOT NULL, uri TEXT NOT NULL, "
+                "mime_type TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, digest):
+        """Returns the live upload for ``digest`` as a dict, or ``None``."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            db = self._db()
+            if entry is None and db is not None:
+                row = db.execute(
+                    "SELECT name, uri, mime_type, expires FROM uploads WHERE digest = ?", (digest,)
+                ).fetchone()
+                if row is not None:
+                    entry = dict(zip(("name", "uri", "mime_type", "expires"), row))
+                    self._entries[digest] = entry
+
+            if entry is None:
+                return None
+            if entry["expires"] - self.margin <= now:
+                self._entries.pop(digest, None)
+                if db is not None:
+                    db.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+                return None
+            return entry
+
+    def put(self, digest, name, uri, mime_type, expires):
+        """Records an uploaded file under ``digest``."""
+        entry = {"name": name, "uri": uri, "mime_type": mime_type, "expires": expires}
+        with self._lock:
+            self._entries[digest] = entry
+            db = self._db()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO uploads (digest, name, uri, mime_type, expires) VALUES (?, ?, ?, ?, ?)",
+                    (digest, name, uri, mime_type, expires),
+                )
@@ -0,0 +1,302 @@
+import re
+import time
+import random
+import asyncio
+import threading
+
+# Status codes worth retrying: rate limited, or the service failing on its side
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+# Retry hints Gemini puts in error messages, e.g. "Please retry in 13.2s" or "retry_delay { seconds: 13 }"
+RETRY_HINT_PATTERNS = [
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+]
+
+
+class CircuitOpen(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def error_code(error):
+    """Returns the HTTP-style status code of an upstream error, or ``None``."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        # gRPC errors expose the code as a method
+        try:
+            code = code()
+        except Exception:
+            return None
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_hint(error):
+    """Returns the delay in seconds the server asked for before retrying, or ``None``."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+
+    message = str(error)
+    for pattern in RETRY_HINT_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def estimate_tokens(contents):
+    """Roughly estimates the input tokens of a prompt, at four characters a token."""
+    if isinstance(contents, str):
+        return len(contents) // 4 + 1
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents)
+    # Files and images are charged a flat amount, about what Gemini bills for an image
+    return 258
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute`` tokens a minute.
+
+    ``reserve`` takes tokens even when the bucket runs short and returns how
+    long the caller must wait for them, so callers queue up fairly in arrival
+    order. Bursts are capped at ``capacity``, ten seconds' worth by default.
+    A rate of ``0`` disables the bucket.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or max(1, per_minute / 6)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Takes ``amount`` tokens and returns the seconds to wait until they are covered."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount):
+        """Charges (or refunds, when negative) the difference between a reservation and actual use."""
+        if not self.rate:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class CircuitBreaker:
+    """Stops calling upstream after ``threshold`` consecutive failures.
+
+    Once open, calls are rejected for ``reset_timeout`` seconds; then a single
+    probe call is let through (half-open) and its outcome closes or reopens
+    the circuit. A probe that reports no outcome within ``probe_timeout``
+    seconds (``reset_timeout`` by default) reopens it too.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30, probe_timeout=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises ``CircuitOpen`` if the call must not go upstream."""
+        if not self.threshold:
+            return
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self.state == "half_open" and now - self._probe_started >= self.probe_timeout:
+                # The probe never reported back
+                self.state = "open"
+                self._opened_at = now
+            remaining = self._opened_at + self.reset_timeout - now
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self._probe_started = now
+                return
+            raise CircuitOpen(max(remaining, 0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """Rate limiting, retries and a circuit breaker around upstream model calls.
+
+    Every attempt, retries included, first waits for the requests-per-minute
+    and tokens-per-minute buckets, then goes through the circuit breaker. Rate limit and server
+    errors are retried up to ``max_retries`` times with full-jitter
+    exponential backoff, or after the delay the server asked for when it sent
+    one. One guard is shared by every generator, so they draw from the same
+    quota.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_retries=3,
+                 base_delay=0.5, max_delay=20.0, breaker_threshold=5, breaker_reset=30.0, seed=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.limited = 0
+        self.limiter_wait = 0.0
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _acquire(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait:
+            self._count("limited")
+            self._count("limiter_wait", wait)
+        return wait
+
+    def _settle(self, tokens, response):
+        usage = getattr(response, "usage_metadata", None)
+        total = getattr(usage, "total_token_count", None)
+        if total:
+            self.tokens.adjust(total - tokens)
+
+    def _backoff(self, attempt, error):
+        """Returns the delay before retrying after ``error``, or ``None`` if it must not be retried."""
+        if attempt >= self.max_retries or error_code(error) not in RETRYABLE_CODES:
+            return None
+        hint = retry_hint(error)
+        if hint is not None:
+            # Waiting longer than the backoff cap would only tie up the caller
+            return hint if hint <= self.max_delay else None
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_attempt(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self._count("rejected")
+            raise
+        self._count("calls")
+
+    def _after_failure(self, attempt, error):
+        if error_code(error) in RETRYABLE_CODES:
+            self.breaker.record_failure()
+        else:
+            # Upstream answered, the request itself was bad
+            self.breaker.record_success()
+        delay = self._backoff(attempt, error)
+        if delay is None:
+            self._count("failures")
+        else:
+            self._count("retries")
+        return delay
+
+    def call(self, fn, *args, tokens=1, **kwargs):
+        """Calls ``fn(*args, **kwargs)`` under the limits, retrying transient errors."""
+        attempt = 0
+        while True:
+            # Retries draw from the buckets like any call
+            wait = self._acquire(tokens)
+            if wait:
+                time.sleep(wait)
+            self._before_attempt()
+            try:
+                response = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Killed or cancelled mid-call, e.g. by a pool timeout; a half-open probe must not stay pending
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            self._settle(tokens, response)
+            return response
+
+    async def call_async(self, fn, *args, tokens=1, **kwargs):
+        """Awaits ``fn(*args, **kwargs)`` under the limits, retrying transient errors."""
+        attempt = 0
+        while True:
+            wait = self._acquire(tokens)
+            if wait:
+                await asyncio.sleep(wait)
+            self._before_attempt()
+            try:
+                response = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            self._settle(tokens, response)
+            return response
+
+    def stats(self):
+        """Returns the guard counters as a dict."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "limited": self.limited,
+                "limiter_wait_seconds": round(self.limiter_wait, 3),
+                "breaker_state": self.breaker.state,
+                "breaker_opened": self.breaker.opened,
+            }
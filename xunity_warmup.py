@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from collections import Counter
+from gevent.pool import Pool
+
+from auto_translator import BULK_CONCURRENCY, translate_bulk_item
+from model_backend import upstream_stats
+from translation_cache import normalize_text
+from translation_memory import mask
+
+# Seconds between rewrites of the translation files during a run
+WARMUP_SAVE_INTERVAL = 30
+
+# XUnity escapes these characters in translation files
+ESCAPES = {"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t", "=": "\\="}
+UNESCAPES = {"n": "\n", "r": "\r", "t": "\t"}
+
+
+def escape(text):
+    """Escapes a text for one side of a ``source=translation`` line."""
+    escaped = "".join(ESCAPES.get(character, character) for character in text)
+    # A line starting with "//" would be read as a comment
+    return "\\/" + escaped[1:] if escaped.startswith("//") else escaped
+
+
+def unescape(text):
+    """Reverts ``escape``; a backslash before any other character keeps that character."""
+    characters = []
+    index = 0
+    while index < len(text):
+        character = text[index]
+        if character == "\\" and index + 1 < len(text):
+            index += 1
+            character = UNESCAPES.get(text[index], text[index])
+        characters.append(character)
+        index += 1
+    return "".join(characters)
+
+
+def parse_line(line):
+    """Returns ``(source, translation)`` for a translation line, or ``None`` for anything else.
+
+    Comments, ``#set`` directives and ``r:``/``sr:`` regex rules are not
+    translation lines and are kept as they are when the file is written back.
+    """
+    if not line.strip() or line.startswith(("//", "#set ", "#unset ", "r:", "sr:")):
+        return None
+    index = 0
+    while True:
+        index = line.find("=", index)
+        if index == -1:
+            return None
+        # Counts the backslashes before the "=", since "\\=" is an escaped backslash then a separator
+        backslashes = len(line[:index]) - len(line[:index].rstrip("\\"))
+        if backslashes % 2 == 0:
+            break
+        index += 1
+    source = unescape(line[:index])
+    if not source:
+        return None
+    return source, unescape(line[index + 1:])
+
+
+def load_translation_file(path):
+    """Returns the lines of a translation file, each as ``(raw line, source or None, translation)``."""
+    entries = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f.read().splitlines():
+            parsed = parse_line(line)
+            entries.append((line, *parsed) if parsed else (line, None, None))
+    return entries
+
+
+def write_translation_file(path, entries, translations):
+    """Writes ``entries`` back to ``path`` with the missing translations filled in from ``translations``.
+
+    The file is replaced in one step, so an interrupted write leaves the old one.
+    """
+    lines = []
+    for line, source, translation in entries:
+        if source is not None and not translation and translations.get(source):
+            line = f"{escape(source)}={escape(translations[source])}"
+        lines.append(line)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def prioritize(sources):
+    """Orders distinct texts for translation and splits them into two passes.
+
+    Texts seen most often come first, grouped by how many texts share their
+    translation-memory template. The first pass holds one text per template,
+    so by the second pass the memory can answer most of the rest without a
+    model call.
+    """
+    counts = Counter(sources)
+    templates = {source: mask(normalize_text(source))[0] for source in counts}
+    template_counts = Counter()
+    for source, count in counts.items():
+        template_counts[templates[source]] += count
+
+    ordered = sorted(counts, key=lambda source: (-template_counts[templates[source]], -counts[source]))
+    first, rest, seen = [], [], set()
+    for source in ordered:
+        if templates[source] in seen:
+            rest.append(source)
+        else:
+            seen.add(templates[source])
+            first.append(source)
+    return first, rest
+
+
+def run_warmup(paths, output_path=None, workers=BULK_CONCURRENCY, save_interval=WARMUP_SAVE_INTERVAL, progress=None):
+    """Translates the untranslated lines of XUnity translation files and fills them in.
+
+    Every text goes through the same glossary, cache, translation memory,
+    batcher and rate-limited upstream path as ``/translate``, so the
+    translations land in the persistent cache the server reads. The files in
+    ``paths`` are written back with the translations filled in, or with
+    ``output_path`` all lines go to that one file instead. Files are rewritten
+    every ``save_interval`` seconds and when the run stops, and texts found in
+    the cache are not sent again, so an interrupted run resumes where it
+    stopped. ``progress`` is an optional callback that receives a status
+    message about once a second. Returns a summary dict.
+    """
+    files = {path: load_translation_file(path) for path in paths}
+    translations = {}
+    for entries in files.values():
+        for _, source, translation in entries:
+            if source is not None and translation:
+                translations.setdefault(source, translation)
+    if output_path and os.path.exists(output_path):
+        for _, source, translation in load_translation_file(output_path):
+            if source is not None and translation:
+                translations.setdefault(source, translation)
+
+    sources = [
+        source for entries in files.values() for _, source, _ in entries
+        if source is not None and source not in translations
+    ]
+    passes = prioritize(sources)
+    total = sum(len(texts) for texts in passes)
+    summary = {
+        "lines": len(sources), "texts": total,
+        "glossary": 0, "cached": 0, "remembered": 0, "translated": 0, "failed": 0,
+    }
+
+    # With an output file, every distinct source of the inputs becomes one line of it
+    targets = files
+    if output_path:
+        every_source = dict.fromkeys(source for entries in files.values() for _, source, _ in entries if source is not None)
+        targets = {output_path: [(f"{escape(source)}=", source, None) for source in every_source]}
+
+    def save():
+        for path, entries in targets.items():
+            write_translation_file(path, entries, translations)
+
+    def translate(text):
+        return (text, *translate_bulk_item(text))
+
+    started = time.monotonic()
+    last_report = last_save = started
+    finished = 0
+    try:
+        for texts in passes:
+            pool = Pool(workers)
+            for text, translation, outcome in pool.imap_unordered(translate, texts):
+                finished += 1
+                summary[outcome] += 1
+                if translation is not None:
+                    translations[text] = translation
+
+                now = time.monotonic()
+                if now - last_save >= save_interval:
+                    save()
+                    last_save = now
+                if now - last_report >= 1 or finished == total:
+                    last_report = now
+                    elapsed = now - started
+                    per_minute = finished / elapsed * 60 if elapsed else 0
+                    remaining = (total - finished) / per_minute * 60 if per_minute else 0
+                    message = (
+                        f"[{finished}/{total}] {per_minute:.0f} lines/min, {summary['glossary']} from glossary, "
+                        f"{summary['cached']} cached, {summary['remembered']} from memory, "
+                        f"{summary['failed']} failed, ETA {remaining:.0f}s"
+                    )
+                    if progress:
+                        progress(message)
+    finally:
+        save()
+
+    summary["seconds"] = time.monotonic() - started
+    summary["lines_per_minute"] = finished / summary["seconds"] * 60 if summary["seconds"] else 0
+    summary["upstream"] = upstream_stats()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-translate XUnity translation files into the translation cache.")
+    parser.add_argument("files", nargs="+", help="_AutoGeneratedTranslations.txt files")
+    parser.add_argument("--output", help="write every line to this file instead of filling in the input files")
+    parser.add_argument("--workers", type=int, default=BULK_CONCURRENCY, help="texts translated at once")
+    parser.add_argument("--save-interval", type=float, default=WARMUP_SAVE_INTERVAL, help="seconds between rewrites of the files")
+    args = parser.parse_args()
+    try:
+        summary = run_warmup(
+            args.files, args.output, args.workers, args.save_interval,
+            progress=lambda message: print(message, flush=True),
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        sys.exit(130)
+    print(json.dumps(summary))
+    sys.exit(1 if summary["failed"] else 0)